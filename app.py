@@ -31,7 +31,8 @@ import os
 import copy
 
 # Multi-dropdown options
-from controls import NLCD_2011, DOYLIST
+from controls import NLCD_2011
+from dataset import get_df, doy_tables
 
 # Get relative data folder
 PATH = pathlib.Path(__file__).parent
@@ -47,9 +48,14 @@ mbt = open(".mapbox_token", 'r')
 mapboxAccessToken = mbt.read().replace('"', '')
 mbt.close()
 
-# Load datasets: Converted in external script from goeJSON to csv with x,y columns
-df = pd.read_csv(DATA_PATH.joinpath('lcDF.csv'), index_col=0, parse_dates=['variable'])
-df.columns = ['PointID', 'LC_code', 'reference_date', 'ndvi', 'lon', 'lat']
+# Load datasets: Converted in external script from goeJSON to csv with x,y columns.
+#  The DRB dataset, loaded once and shared, see dataset.get_df. Its DOY
+#  lookups come from the same dataset, not the controls.py default.
+DATASET_NAME = 'lcDF'
+df = get_df(DATASET_NAME)
+doy_lookups = doy_tables(DATASET_NAME)
+DOYLIST = doy_lookups.DOYLIST
+DOY2DATETIMEDICT = doy_lookups.DOY2DATETIMEDICT
 
 layout = dict(
     autosize=True,
@@ -83,7 +89,7 @@ lc_options = [
     {"label": str(NLCD_2011[lc_class]), "value": str(lc_class)} for lc_class in NLCD_2011
 ]
 
-doy_to_ref_date = dict(zip(DOYLIST, df.reference_date.unique()))
+doy_to_ref_date = DOY2DATETIMEDICT
 
 # TODO: if the previous variables work, delete this.
 # # Controls (dropdowns)
@@ -101,8 +107,8 @@ layout_right['margin-top'] = '20'
 layout_right['font-size'] = '12'
 
 # Define min and max LC codes for color mapping
-lc_max = df['LC_code'].max()
-lc_min = df['LC_code'].min()
+lc_max = df['LC_code'].cat.categories.max()
+lc_min = df['LC_code'].cat.categories.min()
 
 
 # TODO: This should change to discrete color map for categorical LC classes
@@ -18,7 +18,8 @@ import copy
 import pandas as pd
 
 # Multi-dropdown options
-from controls import NLCD_2011, DOYLIST
+from controls import NLCD_2011
+from dataset import get_df, doy_tables
 
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 
@@ -30,9 +31,13 @@ app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
 
 server = app.server
 
-# Load datasets: Converted in external script from goeJSON to csv with x,y columns
-df = pd.read_csv(DATA_PATH.joinpath('lcDF.csv'), index_col=0, parse_dates=['variable'])
-df.columns = ['PointID', 'LC_code', 'reference_date', 'ndvi', 'lon', 'lat']
+# Load datasets: Converted in external script from goeJSON to csv with x,y columns.
+#  The DRB dataset, loaded once and shared, see dataset.get_df. Its DOY
+#  lookups come from the same dataset, not the controls.py default.
+DATASET_NAME = 'lcDF'
+df = get_df(DATASET_NAME)
+doy_lookups = doy_tables(DATASET_NAME)
+DOYLIST = doy_lookups.DOYLIST
 
 # Create controls
 lc_options = [
@@ -191,7 +196,7 @@ app.layout = html.Div(
                             'data': [
                                 dict(
                                     type='scattergl',
-                                    x=df[df['LC_code'] == 41]['reference_date'],
+                                    x=df[df['LC_code'] == 41]['doy'],
                                     y=df[df['LC_code'] == 41]['ndvi'],
                                     text=df[df['LC_code'] == 41]['PointID'],
                                     mode='markers',
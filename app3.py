@@ -28,7 +28,8 @@ from scipy import signal
 
 
 # Multi-dropdown options
-from controls import NLCD_2011, DOYLIST, DOYDICT, DOY2DATETIMEDICT, DATETIME2DOYDICT
+from controls import NLCD_2011
+from dataset import get_df, doy_tables
 
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 
@@ -47,9 +48,16 @@ mbt = open(".mapbox_token", 'r')
 mapboxAccessToken = mbt.read().replace('"', '')
 mbt.close()
 
-# Load datasets: Converted in external script from goeJSON to csv with x,y columns
-df = pd.read_csv(DATA_PATH.joinpath('lcDF.csv'), index_col=0, parse_dates=['variable'])
-df.columns = ['PointID', 'LC_code', 'reference_date', 'ndvi', 'lon', 'lat']
+# Load datasets: Converted in external script from goeJSON to csv with x,y columns.
+#  The DRB dataset, loaded once and shared, see dataset.get_df. Its DOY
+#  lookups come from the same dataset, not the controls.py default.
+DATASET_NAME = 'lcDF'
+df = get_df(DATASET_NAME)
+doy_lookups = doy_tables(DATASET_NAME)
+DOYLIST = doy_lookups.DOYLIST
+DOYDICT = doy_lookups.DOYDICT
+DOY2DATETIMEDICT = doy_lookups.DOY2DATETIMEDICT
+DATETIME2DOYDICT = doy_lookups.DATETIME2DOYDICT
 
 # Create controls
 lc_options = [
@@ -215,7 +223,7 @@ def map_selection(lc_ID, doy):
     # Landcover class filter
     dff = dff[dff['LC_code'] == int(lc_ID)]
     # DOY filter
-    dff = dff[dff['reference_date' ] == DOY2DATETIMEDICT[doy]]
+    dff = dff[dff['doy'] == doy]
     return gen_map(dff)
 
 # @app.callback(
@@ -254,7 +262,6 @@ def lc_scatter_update(value):
     dff = df.copy()
     # Landcover class filter
     dff = dff[dff['LC_code'] == int(value)]
-    dff['doy'] = dff['reference_date'].map(DATETIME2DOYDICT)
 
     return px.scatter(dff, x='doy', y='ndvi', trendline='lowess')
     # return {
@@ -315,7 +322,6 @@ def lc_scatter_update(value):
     dff = df.copy()
     # Landcover class filter
     dff = dff[dff['LC_code'] == int(value)]
-    dff['doy'] = dff['reference_date'].map(DATETIME2DOYDICT)
     return px.violin(dff, x='doy', y='ndvi', box=True)
 
 @app.callback(
@@ -340,7 +346,7 @@ def scatter_update(lc_ID, hoverData):
         'data': [
             dict(
                 type='scattergl',
-                x=list(dff['reference_date']),
+                x=list(dff['doy']),
                 y=list(dff['ndvi']),
                 # text=list(dff['PointID']),
                 mode='lines+markers',
@@ -29,6 +29,7 @@ from scipy import signal
 
 # Multi-dropdown options
 from controls import NLCD_2011, DOYLIST, DOYDICT, DOY2DATETIMEDICT, DATETIME2DOYDICT
+from dataset import get_df
 
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 
@@ -51,11 +52,10 @@ mbt.close()
 # Using the config var in heroku (https://devcenter.heroku.com/articles/config-vars)
 # mapboxAccessToken = str(os.environ.get('MAPBOX_ACCESS_TOKEN'))
 
-# Load datasets: Converted in external script from goeJSON to csv with x,y columns
-#  NOTE: lcDF.csv for DRB, lcDF_conus.csv for conus
-df = pd.read_csv(DATA_PATH.joinpath('lcDF_conus.csv'), index_col=0, parse_dates=['variable'])
-
-df.columns = ['PointID', 'LC_code', 'reference_date', 'ndvi', 'lon', 'lat']
+# Load datasets: Converted in external script from goeJSON to csv with x,y columns.
+#  Shared with controls.py and loaded once, see dataset.get_df.
+#  NOTE: set PHENOLOGY_DATASET to lcDF for DRB, lcDF_conus for conus
+df = get_df()
 
 # Create controls
 lc_options = [
@@ -264,7 +264,7 @@ def map_selection(lc_ID, doy):
     # Landcover class filter
     dff = dff[dff['LC_code'] == int(lc_ID)]
     # DOY filter
-    dff = dff[dff['reference_date' ] == DOY2DATETIMEDICT[doy]]
+    dff = dff[dff['doy'] == doy]
     return gen_map(dff)
 
 # Tabs, scatterplot and boxplot
@@ -278,7 +278,6 @@ def render_tab_content(active_tab, value):
     dff = df.copy()
     # Landcover class filter
     dff = dff[dff['LC_code'] == int(value)]
-    dff['doy'] = df['reference_date'].map(DATETIME2DOYDICT)
 
     if active_tab is not None:
         if active_tab == 'scatter':
@@ -319,7 +318,7 @@ def scatter_update(lc_ID, hoverData):
         'data': [
             dict(
                 type='scattergl',
-                x=list(dff['reference_date']),
+                x=list(dff['doy']),
                 y=list(dff['ndvi']),
                 mode='lines+markers',
                 opacity=0.7,
@@ -13,21 +13,34 @@ import dash
 import dash_core_components as dcc
 import dash_html_components as html
 from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 import plotly.graph_objects as go
-import plotly.express as px
 import os
 import copy
-import pandas as pd
 import dash_bootstrap_components as dbc
-import datashader as ds
-from datashader import transfer_functions as tf
+import flask
+try:
+    from dash import Patch
+except ImportError:
+    # dash < 2.9: every map update sends the full figure
+    Patch = None
 import numpy as np
 import scipy
 from scipy import signal
 
 
 # Multi-dropdown options
-from controls import NLCD_2011, DOYLIST, DOYDICT, DOY2DATETIMEDICT, DATETIME2DOYDICT
+from controls import NLCD_2011, DOYLIST, DOYDICT
+from dataset import (get_cube, get_view, get_smoothed, get_harmonics, get_centroids,
+                     get_clusters, dataset_version, CLUSTER_PREFIX)
+from caching import LRUCache, SingleFlight, cached_call
+import tiles
+import viewport
+from encoding import figure_array, typed_array
+from coalesce import Coalescer, Superseded
+import summaries
+import colouring
+import timeseries
 
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 
@@ -38,6 +51,7 @@ DATA_PATH = PATH.joinpath('data').resolve()
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
 
 server = app.server
+tiles.init_app(server)
 
 #
 # Load mapbox token
@@ -50,14 +64,36 @@ mbt.close()
 # # Using the config var in heroku (https://devcenter.heroku.com/articles/config-vars)
 # mapboxAccessToken = str(os.environ.get('MAPBOX_ACCESS_TOKEN'))
 
-# Load datasets: Converted in external script from goeJSON to csv with x,y columns
-df = pd.read_csv(DATA_PATH.joinpath('lcDF_conus.csv'), index_col=0, parse_dates=['variable'])
-df.columns = ['PointID', 'LC_code', 'reference_date', 'ndvi', 'lon', 'lat']
+# Load datasets: Converted in external script from goeJSON to csv with x,y columns.
+#  Shared with controls.py and loaded once as a point x DOY cube, see
+#  dataset.get_cube. A class is a row slice and a DOY a column of it.
+cube = get_cube()
+
+# Map figures keyed by (dataset version, host, land cover class, colour
+# layer, DOY, view).
+# The default holds every class x DOY combination at one view; MAP_CACHE_MB
+# bounds the memory used.
+map_cache = LRUCache(
+    maxsize=int(os.environ.get('MAP_CACHE_SIZE', len(NLCD_2011) * len(DOYLIST))),
+    maxbytes=int(float(os.environ.get('MAP_CACHE_MB', 512)) * 2 ** 20),
+)
+
+# Latest map request per page, so renders of DOYs the slider has already
+# moved past are dropped
+map_requests = Coalescer()
+
+# Scatter and boxplot tab figures keyed by (dataset version, tab, class)
+tab_cache = LRUCache(maxsize=2 * len(NLCD_2011))
+# Concurrent requests for the same map or tab figure share one computation
+figure_flights = SingleFlight()
 
 # Create controls
 lc_options = [
     {"label": str(NLCD_2011[lc_class]), "value": str(lc_class)} for lc_class in NLCD_2011
 ]
+colour_options = [
+    {"label": layer.label, "value": key} for key, layer in colouring.LAYERS.items()
+]
 
 infoModal = html.H1(
     [
@@ -83,6 +119,15 @@ controls = dbc.Row(
             dbc.FormGroup(
                 [
                     dbc.Label('Select Landcover Class'),
+                    dcc.RadioItems(
+                        id='group-radio',
+                        options=[
+                            {'label': 'Land cover', 'value': 'lc'},
+                            {'label': 'NDVI curve cluster', 'value': 'cluster'},
+                        ],
+                        value='lc',
+                        labelStyle={'display': 'inline-block', 'margin-right': '1em'},
+                    ),
                     dcc.Dropdown(
                         id='lc-class-dropdown',
                         options=lc_options,
@@ -91,7 +136,21 @@ controls = dbc.Row(
                     ),
                 ]
             ),
-            width = 6,
+            width = 4,
+        ),
+        dbc.Col(
+            dbc.FormGroup(
+                [
+                    dbc.Label('Color points by'),
+                    dcc.Dropdown(
+                        id='map-colour-dropdown',
+                        options=colour_options,
+                        value='ndvi',
+                        clearable=False,
+                    ),
+                ]
+            ),
+            width = 4,
         ),
         dbc.Col(
             dbc.FormGroup(
@@ -109,7 +168,7 @@ controls = dbc.Row(
                     ),
                 ]
             ),
-            width=6,
+            width=4,
         ),
     ],
     form=True,
@@ -144,51 +203,59 @@ controls = dbc.Row(
 #     )
 # )
 
-# Function for generating the map
-def gen_map(map_data):
-    # Create a datashader xarray object (agg)
-    cvs = ds.Canvas(plot_width=1000, plot_height=1000)
-    agg = cvs.points(map_data, x = 'lon', y = 'lat')
-
-    coords_lat, coords_lon = agg.coords['lat'].values, agg.coords['lon'].values
-
-    # Corners of the image, which need to be passed to mapbox
-    coordinates = [[coords_lon[0], coords_lat[0]],
-                   [coords_lon[-1], coords_lat[0]],
-                   [coords_lon[-1], coords_lat[-1]],
-                   [coords_lon[0], coords_lat[-1]]]
-
-    img = tf.shade(agg)[::-1].to_pil()
+# Most points sent to the map for one view, past that they are aggregated
+MAP_POINT_BUDGET = int(os.environ.get('MAP_POINT_BUDGET', 5000))
+# Points of a class drawn in the Scatter tab, under its trendline of all points
+SCATTER_MAX_POINTS = int(os.environ.get('SCATTER_MAX_POINTS', 2000))
+# Classes with at most this many points have their whole (points x DOYs) NDVI
+# matrix sent to the browser, which then recolours the map for each DOY
+PRELOAD_MAX_POINTS = int(os.environ.get('PRELOAD_MAX_POINTS', 20000))
 
+# Function for generating the map
+def gen_map(map_data, tile_source, aggregated=False, layer=colouring.LAYERS['ndvi']):
+    # Datashader layer as XYZ raster tiles rendered on demand by tiles.py, so
+    # only the visible tiles are generated, at the resolution of the zoom
     layers = [
         {
-            'sourcetype': 'image',
-            'source': img,
-            'coordinates': coordinates
+            'sourcetype': 'raster',
+            'source': [tile_source],
+            'below': 'traces',
         }
     ]
 
+    if aggregated:
+        # More points in view than MAP_POINT_BUDGET: one marker per grid cell.
+        # Their counts go in hovertext, so only real points have a text (the
+        # PointID scatter_update reads from hoverData).
+        labels = {'hovertext': map_data['count'].to_numpy().astype(str).tolist()}
+        hovertemplate = ("Points: <b>%{hovertext}</b><br><br>" +
+                         "Mean " + layer.label + ": <b>%{customdata}</b><br>" +
+                         "<extra></extra>")
+    else:
+        labels = {'text': map_data['PointID'].to_numpy(dtype=str).tolist()}
+        hovertemplate = ("Point ID: <b>%{text}</b><br><br>" +
+                         layer.label + ": <b>%{customdata}</b><br>" +
+                         "<extra></extra>")
+
     map_graph =  {
         "data": [
             {
                 'type': 'scattermapbox',
-                'lat': list(map_data['lat']),
-                'lon': list(map_data['lon']),
-                'text': list(map_data['PointID']),
-                'customdata': list(map_data['ndvi']),
-
-                'hovertemplate':
-                    "Point ID: <b>%{text}</b><br><br>" +
-                    "NDVI: <b>%{customdata}</b><br>" +
-                    "<extra></extra>",
+                # Numeric columns go out as base64 typed arrays
+                'lat': figure_array(map_data['lat'], np.float32),
+                'lon': figure_array(map_data['lon'], np.float32),
+                **labels,
+                'customdata': figure_array(map_data['ndvi'], np.float32),
+
+                'hovertemplate': hovertemplate,
                 'mode': 'markers',
                 'marker': {
                     'size': 6,
                     'opacity': 0.7,
-                    'color': map_data['ndvi'],
-                    'colorscale': [[0, 'white'], [1,'green']],
-                    'cmin': 0,
-                    'cmax': 10000
+                    'color': figure_array(map_data['ndvi'], np.float32),
+                    'colorscale': layer.colorscale,
+                    'cmin': layer.cmin,
+                    'cmax': layer.cmax
                 }
             }
         ],
@@ -261,6 +328,11 @@ app.layout = dbc.Container(
             justify='end'
         ),
 
+        # Map figure from the server, class NDVI matrix for client-side DOY
+        # changes and the DOY the server renders, see recolourMap
+        dcc.Store(id='map-figure'),
+        dcc.Store(id='class-ndvi'),
+        dcc.Store(id='server-doy', data={'doy': 177}),
         dbc.Row(
             [
                 dbc.Col(
@@ -303,25 +375,352 @@ def toggle_modal(n1, n2, is_open):
         return not is_open
     return is_open
 
-# Map graph
+def map_frame(lc_ID, doy, colour):
+    # Landcover class and DOY filter. Points missing this composite are kept
+    # (NaN) so the point set does not change with the DOY.
+    dff = get_view(lc_ID).doy_frame(doy, dropna=False)
+    if colour != 'ndvi':
+        # Other colour layers travel in the ndvi column too
+        dff['ndvi'] = colouring.layer_values(colour, lc_ID, doy)
+    return dff
+
+def map_meta(lc_ID, colour, bounds):
+    # Group, layer and view of a map figure, kept in its layout.meta. The
+    # browser sends back the meta of the figure it holds, so the server only
+    # patches a figure with the same points in the same order.
+    return {'lc': str(lc_ID), 'colour': colour,
+            'bounds': None if bounds is None else list(bounds)}
+
+def build_map(lc_ID, doy, bounds, budget, tile_source, colour='ndvi'):
+    dff = map_frame(lc_ID, doy, colour)
+    # Viewport filter, aggregated past the point budget
+    dff, aggregated = viewport.select_points(dff, bounds, budget)
+    map_graph = gen_map(dff, tile_source, aggregated, colouring.LAYERS[colour])
+    # Also lets recolourMap check the figure matches the preloaded class
+    map_graph['layout']['meta'] = map_meta(lc_ID, colour, bounds)
+    return map_graph
+
+# Layers with a regular series (e.g. gap-filled daily NDVI) can be shown on
+# any of its days, the others on the composite DOYs only
+@app.callback(
+    [Output('doy-slider', 'step'),
+     Output('doy-slider', 'value')],
+    [Input('map-colour-dropdown', 'value')],
+    [State('doy-slider', 'value')]
+)
+def slider_step(colour, doy):
+    step = colouring.LAYERS[colour].step
+    if step is not None:
+        return step, dash.no_update
+    nearest = min(DOYLIST, key=lambda d: abs(d - doy))
+    return 16, nearest if nearest != doy else dash.no_update
+
+def cluster_options():
+    # One option per k-means cluster of the NDVI curves, see dataset.get_view
+    centroids = get_centroids()
+    sizes = np.bincount(np.asarray(get_clusters()) + 1, minlength=len(centroids) + 1)[1:]
+    doys = get_cube().doys
+    return [
+        {"label": 'Cluster {}: {} points, peak DOY {}'.format(
+            i + 1, sizes[i], doys[np.argmax(centroid)]),
+         "value": CLUSTER_PREFIX + str(i)}
+        for i, centroid in enumerate(centroids)
+    ]
+
+# The map, tabs and preload take either a land cover class or a cluster of
+# points with similar NDVI curves from the same dropdown
+@app.callback(
+    [Output('lc-class-dropdown', 'options'),
+     Output('lc-class-dropdown', 'value')],
+    [Input('group-radio', 'value')],
+    [State('lc-class-dropdown', 'value')]
+)
+def group_options(group, lc_ID):
+    clusters = group == 'cluster'
+    if str(lc_ID).startswith(CLUSTER_PREFIX) == clusters:
+        return (cluster_options() if clusters else lc_options), dash.no_update
+    if clusters:
+        return cluster_options(), CLUSTER_PREFIX + '0'
+    return lc_options, '41'
+
+def is_preloaded(lc_ID):
+    return len(get_view(lc_ID)) <= PRELOAD_MAX_POINTS
+
+# Class NDVI matrix for client-side DOY changes, None for large classes
+@app.callback(
+    Output('class-ndvi', 'data'),
+    [Input('lc-class-dropdown', 'value')]
+)
+def preload_class(lc_ID):
+    if not is_preloaded(lc_ID):
+        return None
+
+    # Same rows, in the same order, as the points of the map figure
+    view = get_view(lc_ID)
+    matrix = view.ndvi
+    return {
+        'lc': str(lc_ID),
+        'doys': view.doys.tolist(),
+        'n_points': len(matrix),
+        # Missing composites as -1. Always a typed array, since recolourMap
+        # decodes it rather than plotly.js
+        'ndvi': typed_array(np.where(np.isnan(matrix), -1, matrix).ravel(), np.int16),
+    }
+
+# DOY for the server map callback. Slider moves on preloaded classes coloured
+# by NDVI stay in the browser.
+app.clientside_callback(
+    """
+    function(doy, classNdvi, colour, figure) {
+        if (colour === 'ndvi' && classNdvi && classNdvi.doys.indexOf(doy) >= 0) {
+            return window.dash_clientside.no_update;
+        }
+        // Page id and sequence number let the server drop superseded renders
+        if (!window.phenoSession) {
+            window.phenoSession = Math.random().toString(36).slice(2);
+            window.phenoDoySeq = 0;
+        }
+        window.phenoDoySeq += 1;
+        // Meta of the figure this page holds, which a DOY-only Patch must match
+        var held = figure && figure.layout && figure.layout.meta || null;
+        return {doy: doy, session: window.phenoSession, seq: window.phenoDoySeq,
+                held: held};
+    }
+    """,
+    Output('server-doy', 'data'),
+    [Input('doy-slider', 'value'),
+     Input('class-ndvi', 'data'),
+     Input('map-colour-dropdown', 'value')],
+    [State('map-figure', 'data')]
+)
+
+# Map graph: the server figure, recoloured in the browser for the slider DOY
+# when the class matrix is preloaded and the points are coloured by NDVI
+# (recolourMap)
+app.clientside_callback(
+    """
+    function recolourMap(figure, doy, classNdvi) {
+        if (!figure) {
+            return window.dash_clientside.no_update;
+        }
+        var j = classNdvi ? classNdvi.doys.indexOf(doy) : -1;
+        var meta = figure.layout.meta;
+        if (j < 0 || !meta || meta.lc !== classNdvi.lc || meta.colour !== 'ndvi') {
+            return figure;
+        }
+        if (!classNdvi.values) {
+            // Decoded once per class and kept on the store data
+            var raw = atob(classNdvi.ndvi.bdata);
+            var bytes = new Uint8Array(raw.length);
+            for (var i = 0; i < raw.length; i++) {
+                bytes[i] = raw.charCodeAt(i);
+            }
+            classNdvi.values = new Int16Array(bytes.buffer);
+        }
+        var n = classNdvi.n_points, k = classNdvi.doys.length;
+        var ndvi = new Float32Array(n);
+        for (var p = 0; p < n; p++) {
+            var v = classNdvi.values[p * k + j];
+            ndvi[p] = v < 0 ? NaN : v;
+        }
+
+        var trace = Object.assign({}, figure.data[0], {
+            customdata: ndvi,
+            marker: Object.assign({}, figure.data[0].marker, {color: ndvi})
+        });
+        var layer = Object.assign({}, figure.layout.mapbox.layers[0], {
+            source: [figure.layout.mapbox.layers[0].source[0].replace(
+                /\/tiles\/([^\/]+)\/([^\/]+)\/\d+\//, '/tiles/$1/$2/' + doy + '/')]
+        });
+        var mapbox = Object.assign({}, figure.layout.mapbox, {layers: [layer]});
+        return Object.assign({}, figure, {
+            data: [trace],
+            layout: Object.assign({}, figure.layout, {mapbox: mapbox})
+        });
+    }
+    """,
+    Output('map-graph', 'figure'),
+    [Input('map-figure', 'data'),
+     Input('doy-slider', 'value')],
+    [State('class-ndvi', 'data')]
+)
+
 # TODO: see https://community.plotly.com/t/preserving-ui-state-like-zoom-in-dcc-graph-with-uirevision/15793
 #   about preventing auto resetting map with input (e.g., slider) change.
 @app.callback(
-    Output('map-graph', 'figure'),
+    Output('map-figure', 'data'),
     [Input('lc-class-dropdown', 'value'),
-     Input('doy-slider', 'value')]
+     Input('server-doy', 'data'),
+     Input('map-graph', 'relayoutData'),
+     Input('map-colour-dropdown', 'value')]
 )
-def map_selection(lc_ID, doy):
-    dff = df.copy()
+def map_selection(lc_ID, serverDoy, relayoutData, colour):
+    triggered = [t['prop_id'] for t in dash.callback_context.triggered]
+    doy = serverDoy['doy']
+
+    # Drop the request if a newer one from the same page has been seen
+    request_key = (serverDoy.get('session'), 'map-figure')
+    token = None
+    if request_key[0] is not None:
+        seq = serverDoy['seq'] if triggered == ['server-doy.data'] else None
+        token = map_requests.begin(request_key, seq)
+        if token is None:
+            raise PreventUpdate
+
+    try:
+        return render_map(lc_ID, doy, colour, relayoutData, triggered, request_key, token,
+                          serverDoy.get('held'))
+    except Superseded:
+        raise PreventUpdate
+
+
+def render_map(lc_ID, doy, colour, relayoutData, triggered, request_key, token, held=None):
+    def check():
+        # Stop once a newer request for the map has begun
+        if token is not None:
+            map_requests.check(request_key, token)
+
+    budget = MAP_POINT_BUDGET
+    bounds = viewport.viewport_bounds(relayoutData)
+    if bounds is not None:
+        bounds = tuple(round(x, 3) for x in bounds)
+
+    if is_preloaded(lc_ID):
+        # The whole class is on the map, in the order of the preloaded matrix
+        if triggered == ['map-graph.relayoutData']:
+            raise PreventUpdate
+        bounds = None
+        budget = max(budget, PRELOAD_MAX_POINTS)
+
+    tile_source = tiles.tile_url(flask.request.url_root, lc_ID, doy)
+
+    if (Patch is not None and triggered == ['server-doy.data']
+            and held == map_meta(lc_ID, colour, bounds)):
+        # Only the DOY changed and the page holds a figure of the same points
+        # in the same order, so send just the new values and tiles
+        dff, aggregated = viewport.select_points(
+            map_frame(lc_ID, doy, colour), bounds, budget)
+        check()
+        ndvi = figure_array(dff['ndvi'], np.float32)
+        patch = Patch()
+        patch['data'][0]['customdata'] = ndvi
+        patch['data'][0]['marker']['color'] = ndvi
+        patch['layout']['mapbox']['layers'][0]['source'] = [tile_source]
+        return patch
+
+    # Tile URLs are absolute, so the host is part of the key. The build is
+    # shared with other pages, so it is not stopped when this one moves on.
+    key = (dataset_version(), flask.request.url_root, str(lc_ID), colour, doy, bounds)
+    check()
+    return cached_call(map_cache, figure_flights, key,
+                       lambda: build_map(lc_ID, doy, bounds, budget, tile_source, colour))
+
+# Hit/miss counters of the map figure and tile caches, dropped map requests
+@server.route('/cache-stats')
+def cache_stats():
+    return flask.jsonify(map=map_cache.stats(), tiles=tiles.tile_cache.stats(),
+                         tabs=tab_cache.stats(),
+                         summaries=summaries.summary_cache.stats(),
+                         superseded_map_requests=map_requests.dropped,
+                         shared_figure_builds=figure_flights.shared)
 
-    # Landcover class filter
-    dff = dff[dff['LC_code'] == int(lc_ID)]
-    # DOY filter
-    dff = dff[dff['reference_date' ] == DOY2DATETIMEDICT[doy]]
+# Tabs, scatterplot and boxplot
+def gen_trend_scatter(lc_ID):
+    # Sample of the class points over the LOWESS trendline of all its points,
+    # which summaries.py computes from per-DOY sums and caches
+    doys, ndvi = summaries.sample_points(get_view(lc_ID), SCATTER_MAX_POINTS)
+    trend_doys, trend = summaries.lowess_trend(lc_ID)
+    smooth_doys, smooth = summaries.smoothed_median(lc_ID)
+    return {
+        'data': [
+            dict(
+                type='scattergl',
+                x=figure_array(doys, np.int16),
+                y=figure_array(ndvi, np.float32),
+                mode='markers',
+                name='NDVI',
+                marker={'size': 4, 'opacity': 0.4},
+            ),
+            dict(
+                type='scatter',
+                x=figure_array(trend_doys, np.int16),
+                y=figure_array(trend, np.float32),
+                mode='lines',
+                name='LOWESS trend',
+                line={'width': 3},
+            ),
+            dict(
+                type='scatter',
+                x=figure_array(smooth_doys, np.int16),
+                y=figure_array(smooth, np.float32),
+                mode='lines',
+                name='Median smoothed curve',
+                line={'width': 2, 'dash': 'dash'},
+            ),
+        ],
+        'layout': dict(
+            xaxis={'title': 'doy'},
+            yaxis={'title': 'ndvi', 'range': [0, 10000]},
+            hovermode='closest',
+        )
+    }
 
-    return gen_map(dff)
+def gen_violin(lc_ID):
+    # Violins and boxes drawn from the per-DOY statistics of summaries.py, so
+    # the figure size does not depend on the number of points
+    stats = summaries.violin_stats(lc_ID)
+    doys, grid = stats['doys'], stats['grid']
+    # Widest violin fills most of the gap between two composites
+    half_width = 0.45 * (np.diff(doys).min() if len(doys) > 1 else 16)
+    scale = half_width / max(stats['density'].max(), 1e-12) if len(doys) else 0
+
+    # One closed outline per DOY over its data range, separated by NaN gaps
+    xs, ys = [], []
+    for doy, density, lo, hi in zip(doys, stats['density'], stats['min'], stats['max']):
+        inside = (grid >= lo) & (grid <= hi)
+        y = np.concatenate([[lo], grid[inside], [hi]])
+        w = np.interp(y, grid, density) * scale
+        xs += [doy - w, (doy + w)[::-1], [np.nan]]
+        ys += [y, y[::-1], [np.nan]]
+    xs = np.concatenate(xs) if xs else np.zeros(0)
+    ys = np.concatenate(ys) if ys else np.zeros(0)
+
+    return {
+        'data': [
+            dict(
+                type='scatter',
+                x=figure_array(xs, np.float32),
+                y=figure_array(ys, np.float32),
+                mode='lines',
+                fill='toself',
+                line={'width': 1},
+                name='NDVI density',
+                hoverinfo='skip',
+            ),
+            dict(
+                type='box',
+                x=figure_array(doys, np.int16),
+                q1=figure_array(stats['q1'], np.float32),
+                median=figure_array(stats['median'], np.float32),
+                q3=figure_array(stats['q3'], np.float32),
+                lowerfence=figure_array(stats['lower'], np.float32),
+                upperfence=figure_array(stats['upper'], np.float32),
+                width=half_width / 3,
+                name='NDVI',
+            ),
+        ],
+        'layout': dict(
+            xaxis={'title': 'doy'},
+            yaxis={'title': 'ndvi', 'range': [0, 10000]},
+            showlegend=False,
+        )
+    }
+
+def tab_figure(active_tab, value):
+    if active_tab == 'scatter':
+        return gen_trend_scatter(value)
+    return gen_violin(value)
 
-# Tabs, scatterplot and boxplot
 @app.callback(
     Output('tab-content', 'children'),
     [Input('tabs', 'active_tab'),
@@ -329,23 +728,21 @@ def map_selection(lc_ID, doy):
 )
 def render_tab_content(active_tab, value):
 
-    dff = df.copy()
-    # Landcover class filter
-    dff = dff[dff['LC_code'] == int(value)]
-    dff['doy'] = df['reference_date'].map(DATETIME2DOYDICT)
-
     if active_tab is not None:
+        key = (dataset_version(), active_tab, str(value))
+        figure = cached_call(tab_cache, figure_flights, key,
+                             lambda: tab_figure(active_tab, value))
         if active_tab == 'scatter':
             return  dcc.Graph(
                         id='all-lc-scatter',
-                        figure=px.scatter(dff, x='doy', y='ndvi', trendline='lowess', range_y= [0, 10000]),
+                        figure=figure,
                         responsive= True,
                         style=dict(height='100%', width='100%')
                    ),
         elif active_tab == 'boxplot':
             return dcc.Graph(
                         id='all-lc-boxplot',
-                        figure=px.violin(dff, x='doy', y='ndvi', box=True, range_y= [0, 10000]),
+                        figure=figure,
                         responsive= True,
                         style=dict(height='100%', width='100%')
                     ),
@@ -357,15 +754,25 @@ def render_tab_content(active_tab, value):
      Input('map-graph', 'hoverData')]
 )
 def scatter_update(lc_ID, hoverData):
-    dff = df.copy()
-    # Landcover class filter
-    dff = dff[dff['LC_code'] == int(lc_ID)]
-    # PointID filter from hoverData in mapbox
+    # PointID from hoverData in mapbox
     if hoverData is None:
         return dash.no_update
 
-    pointID = hoverData['points'][0]['text']
-    dff = dff[dff['PointID'] == pointID]
+    point = hoverData['points'][0]
+    if 'text' not in point:
+        # Aggregated marker, not a point
+        return dash.no_update
+    pointID = point['text']
+    # Row of the cube for the hovered point
+    row = cube.row(pointID)
+    if row < 0:
+        return dash.no_update
+    doys, ndvi = cube.series(pointID)
+    # Savitzky-Golay curve of the point, smoothed for all points at once
+    smoothed = get_smoothed()[row]
+    # Daily curve of its harmonic model
+    days = timeseries.regular_doys(1)
+    harmonic = timeseries.harmonic_curves(get_harmonics()[row:row + 1], days)[0]
 
     # # Function for generating scatterplot
     # def gen_scatter(map_data):
@@ -373,15 +780,31 @@ def scatter_update(lc_ID, hoverData):
         'data': [
             dict(
                 type='scattergl',
-                x=list(dff['reference_date']),
-                y=list(dff['ndvi']),
+                x=figure_array(doys, np.int16),
+                y=figure_array(ndvi, np.float32),
                 mode='lines+markers',
                 opacity=0.7,
 
                 marker={
                     'size': 9,
                 },
-            )
+                name='NDVI',
+            ),
+            dict(
+                type='scattergl',
+                x=figure_array(cube.doys, np.int16),
+                y=figure_array(smoothed, np.float32),
+                mode='lines',
+                name='Savitzky-Golay',
+            ),
+            dict(
+                type='scattergl',
+                x=figure_array(days, np.int16),
+                y=figure_array(harmonic, np.float32),
+                mode='lines',
+                name='Harmonic model',
+                line={'dash': 'dot'},
+            ),
         ],
         'layout': dict(
             xaxis={'title': 'Day Of Year (DOY)'},
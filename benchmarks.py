@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Micro benchmarks for the data paths behind the callbacks, on synthetic frames
+of growing size (the real datasets are not part of the repo).
+
+    python benchmarks.py
+"""
+import json
+import time
+
+import numpy as np
+import pandas as pd
+import plotly
+
+import dataset
+from cube import NDVICube
+from encoding import typed_array
+from indexes import PartitionIndex
+
+LC_CODES = [11, 21, 22, 23, 41, 42, 43, 52, 71, 81, 82, 90, 95]
+SIZES = [10000, 100000, 500000]
+
+
+def synthetic(n_points, seed=0):
+    # Long-format frame with the same columns dataset.read_csv returns
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2016-01-01', periods=23, freq='16D')
+    doy = dates.dayofyear.to_numpy()
+    curve = 2000 + 5000 * np.exp(-((doy[None, :] - 190) / 60.0) ** 2)
+    ndvi = (curve + rng.normal(0, 500, (n_points, len(dates)))).clip(0, 10000)
+    return pd.DataFrame({
+        'PointID': np.repeat(['pt_%07d' % i for i in range(n_points)], len(dates)),
+        'LC_code': np.repeat(rng.choice(LC_CODES, n_points), len(dates)),
+        'reference_date': np.tile(dates, n_points),
+        'ndvi': ndvi.ravel().round(),
+        'lon': np.repeat(rng.uniform(-124, -67, n_points), len(dates)),
+        'lat': np.repeat(rng.uniform(25, 49, n_points), len(dates)),
+    })
+
+
+def write_synthetic_csv(name, n_points, seed=0):
+    # synthetic() in the layout of the converted geoJSON csv files, as
+    # data/<name>.csv for the loaders of dataset.py. Never replaces a csv.
+    path = dataset.csv_path(name)
+    if path.exists():
+        raise FileExistsError('{} exists, pick a new dataset name'.format(path))
+    df = synthetic(n_points, seed)
+    df.columns = ['PointID', 'LC_code', 'variable', 'value', 'x', 'y']
+    df.to_csv(path)
+    return path
+
+
+def timeit(func, repeat=20):
+    # Best of `repeat` runs, in milliseconds
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def bench_partition_index():
+    print('map_selection filter (ms)')
+    print('{:>10s} {:>10s} {:>10s}'.format('rows', 'mask', 'index'))
+    for n in SIZES:
+        df = dataset.compact(synthetic(n))
+        index = PartitionIndex(df)
+
+        def mask():
+            dff = df.copy()
+            dff = dff[dff['LC_code'] == 41]
+            return dff[dff['doy'] == 177]
+
+        print('{:>10d} {:>10.3f} {:>10.3f}'.format(
+            len(df), timeit(mask), timeit(lambda: index.rows('41', 177))))
+
+
+def bench_payload():
+    print('map trace serialization (ms, bytes)')
+    print('{:>10s} {:>10s} {:>12s} {:>10s} {:>12s}'.format(
+        'points', 'lists', 'bytes', 'typed', 'bytes'))
+    for n in SIZES:
+        cube = NDVICube.from_frame(dataset.compact(synthetic(n)))
+        # As app5.map_frame sends it: missing composites kept as NaN, so
+        # NDVI goes out as float32
+        map_data = cube.doy_frame(cube.lc[0], 177, dropna=False)
+
+        def as_lists():
+            return json.dumps({
+                'lat': list(map_data['lat']),
+                'lon': list(map_data['lon']),
+                'customdata': list(map_data['ndvi']),
+                'marker': {'color': map_data['ndvi']},
+            }, cls=plotly.utils.PlotlyJSONEncoder)
+
+        def as_typed():
+            return json.dumps({
+                'lat': typed_array(map_data['lat'], np.float32),
+                'lon': typed_array(map_data['lon'], np.float32),
+                'customdata': typed_array(map_data['ndvi'], np.float32),
+                'marker': {'color': typed_array(map_data['ndvi'], np.float32)},
+            }, cls=plotly.utils.PlotlyJSONEncoder)
+
+        print('{:>10d} {:>10.2f} {:>12d} {:>10.2f} {:>12d}'.format(
+            len(map_data), timeit(as_lists, 5), len(as_lists()),
+            timeit(as_typed, 5), len(as_typed())))
+
+
+if __name__ == '__main__':
+    bench_partition_index()
+    bench_payload()
@@ -0,0 +1,157 @@
+# In-process caches shared by the app callbacks
+import collections
+import sys
+import threading
+
+
+def approx_size(obj):
+    """
+    Rough size in bytes of a figure-like value: nested dicts and lists of
+    numbers, strings, NumPy arrays and PIL images.
+    """
+    if hasattr(obj, 'nbytes'):
+        return int(obj.nbytes)
+    if hasattr(obj, 'getbands'):
+        # PIL image
+        return obj.width * obj.height * len(obj.getbands())
+    if isinstance(obj, (str, bytes)):
+        return len(obj)
+    if isinstance(obj, dict):
+        return sum(approx_size(k) + approx_size(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return sum(approx_size(x) for x in obj)
+    return sys.getsizeof(obj)
+
+
+class LRUCache(object):
+    """
+    Thread-safe LRU cache bounded by number of entries and, optionally, by the
+    total approx_size of the values.
+    """
+
+    def __init__(self, maxsize=128, maxbytes=None, sizeof=approx_size):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, size = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = self.sizeof(value) if self.maxbytes is not None else 0
+        with self._lock:
+            if key in self._data:
+                self.nbytes -= self._data.pop(key)[1]
+            self._data[key] = (value, size)
+            self.nbytes += size
+            # Always keep the newest entry, even if it alone is over maxbytes
+            while len(self._data) > 1 and (
+                    len(self._data) > self.maxsize
+                    or (self.maxbytes is not None and self.nbytes > self.maxbytes)):
+                self.nbytes -= self._data.popitem(last=False)[1][1]
+                self.evictions += 1
+
+    def peek(self, key, default=None):
+        # get() without touching the counters or the LRU order
+        with self._lock:
+            entry = self._data.get(key)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._data),
+                'bytes': self.nbytes,
+                'maxsize': self.maxsize,
+                'maxbytes': self.maxbytes,
+            }
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Concurrent calls for the same key wait on one in-progress computation and
+    share its result (or its exception).
+    """
+
+    def __init__(self):
+        self.shared = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+def cached_call(cache, flight, key, func):
+    """
+    Value of `key` in `cache`, else func() computed once across concurrent
+    callers and stored in the cache.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    def compute():
+        # A caller that just finished may have filled the cache
+        value = cache.peek(key)
+        if value is None:
+            value = func()
+            cache.put(key, value)
+        return value
+
+    return flight.do(key, compute)
@@ -0,0 +1,77 @@
+# Typical NDVI of each land cover class on each DOY, and departures from it
+import numpy as np
+import pandas as pd
+
+import timeseries
+
+PERCENTILES = [10, 25, 50, 75, 90]
+STATS = ['count', 'mean', 'std'] + ['p{}'.format(p) for p in PERCENTILES]
+
+
+def climatology(cube):
+    """
+    Table of STATS over the points of each (LC_code, doy), one row per pair,
+    sorted by LC_code then doy. Missing composites are left out.
+    """
+    codes, starts = np.unique(cube.lc, return_index=True)
+    n_doys = len(cube.doys)
+    if not len(codes):
+        return pd.DataFrame(columns=['LC_code', 'doy'] + STATS)
+
+    # Class sums in one pass each over the cube, classes being row blocks
+    valid = ~np.isnan(cube.ndvi)
+    count = np.add.reduceat(valid.astype(np.int32), starts, axis=0)
+    total = np.add.reduceat(np.where(valid, cube.ndvi, 0).astype(np.float64), starts, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        sizes = np.diff(np.append(starts, len(cube.lc)))
+        dev = np.where(valid, cube.ndvi - np.repeat(mean, sizes, axis=0), 0)
+        std = np.sqrt(np.add.reduceat(dev * dev, starts, axis=0) / count)
+
+    # Percentiles need the values sorted, one class block at a time
+    pct = np.full((len(codes), len(PERCENTILES), n_doys), np.nan)
+    for c, (start, size) in enumerate(zip(starts, sizes)):
+        block = cube.ndvi[start:start + size]
+        has_data = count[c] > 0
+        if has_data.any():
+            pct[c][:, has_data] = np.nanpercentile(block[:, has_data], PERCENTILES, axis=0)
+
+    table = pd.DataFrame({
+        'LC_code': np.repeat(codes, n_doys),
+        'doy': np.tile(cube.doys, len(codes)),
+        'count': count.ravel(),
+        'mean': mean.ravel().astype(np.float32),
+        'std': std.ravel().astype(np.float32),
+    })
+    for i, p in enumerate(PERCENTILES):
+        table['p{}'.format(p)] = pct[:, i, :].ravel().astype(np.float32)
+    return table
+
+
+def stat_matrix(table, stat):
+    # (classes x DOYs) array of one column of a climatology table, and the
+    # class codes of its rows
+    codes = table['LC_code'].unique()
+    return table[stat].to_numpy().reshape(len(codes), -1), codes
+
+
+def _anomalies(ndvi, lc, mean, std, codes):
+    rows = np.searchsorted(codes, lc)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = (ndvi - mean[rows]) / std[rows]
+    return np.where(np.isfinite(z), z, np.nan).astype(np.float32)
+
+
+def anomalies(ndvi, lc, table, workers=1):
+    """
+    z-score of every value of `ndvi` against the climatology `table` of its
+    point's class `lc` on the same DOY; NaN where the value is missing or the
+    class has no spread on that DOY.
+    """
+    mean, codes = stat_matrix(table, 'mean')
+    std = stat_matrix(table, 'std')[0]
+    # Blocks of rows carry their slice of `lc` along
+    rows = np.arange(len(ndvi))
+    return timeseries.chunked(
+        lambda block: _anomalies(ndvi[block], lc[block], mean, std, codes),
+        rows, workers=workers)
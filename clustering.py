@@ -0,0 +1,81 @@
+# Mini-batch k-means clustering of the smoothed NDVI curves of all points
+import os
+
+import numpy as np
+
+import timeseries
+
+N_CLUSTERS = int(os.environ.get('KMEANS_K', 8))
+BATCH_SIZE = 4096
+MAX_ITER = 300
+# Stop once no centroid moves more than this (NDVI units) in a batch
+TOL = 1.0
+# Points k-means++ picks the initial centroids from
+INIT_SAMPLE = 10000
+
+
+def _sq_distances(x, centroids):
+    x = np.asarray(x, dtype=np.float64)
+    c = np.asarray(centroids, dtype=np.float64)
+    return (x * x).sum(axis=1)[:, None] - 2 * x @ c.T + (c * c).sum(axis=1)[None, :]
+
+
+def _kmeans_pp(sample, k, rng):
+    centroids = [sample[rng.integers(len(sample))]]
+    d2 = _sq_distances(sample, centroids[:1])[:, 0].clip(0)
+    for _ in range(1, k):
+        p = d2 / d2.sum() if d2.sum() > 0 else None
+        centroids.append(sample[rng.choice(len(sample), p=p)])
+        d2 = np.minimum(d2, _sq_distances(sample, centroids[-1:])[:, 0].clip(0))
+    return np.array(centroids, dtype=np.float64)
+
+
+def fit(curves, k=N_CLUSTERS, batch_size=BATCH_SIZE, max_iter=MAX_ITER, seed=0):
+    """
+    (k x DOYs) centroids of mini-batch k-means (Sculley, 2010) over the rows
+    of `curves`, gap-free series such as dataset.get_smoothed; rows of NaN
+    are skipped. Only random batches of rows are read, so `curves` can be a
+    memory-mapped array of any size.
+    """
+    rng = np.random.default_rng(seed)
+    usable = np.flatnonzero(~np.isnan(curves[:, 0]))
+    if len(usable) < k:
+        raise ValueError('{} curves cannot form {} clusters'.format(len(usable), k))
+
+    init = np.sort(rng.choice(usable, min(len(usable), INIT_SAMPLE), replace=False))
+    centroids = _kmeans_pp(np.asarray(curves[init], dtype=np.float64), k, rng)
+    seen = np.zeros(k)
+    for _ in range(max_iter):
+        batch = np.asarray(curves[np.sort(usable[rng.integers(0, len(usable), batch_size)])],
+                           dtype=np.float64)
+        labels = _sq_distances(batch, centroids).argmin(axis=1)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, batch)
+
+        # Each centroid moves towards its batch mean with a step of
+        # (points this batch / points so far)
+        hit = counts > 0
+        seen += counts
+        step = np.zeros(k)
+        step[hit] = counts[hit] / seen[hit]
+        means = np.where(hit[:, None], sums / np.maximum(counts, 1)[:, None], centroids)
+        moved = step[:, None] * (means - centroids)
+        centroids += moved
+        if np.abs(moved).max() < TOL:
+            break
+    return centroids.astype(np.float32)
+
+
+def _assign(curves, centroids):
+    labels = _sq_distances(curves, centroids).argmin(axis=1).astype(np.int16)
+    labels[np.isnan(curves[:, 0])] = -1
+    return labels
+
+
+def assign(curves, centroids, workers=1):
+    """
+    Cluster of the nearest centroid for every row of `curves`, -1 for rows
+    of NaN.
+    """
+    return timeseries.chunked(_assign, curves, centroids, workers=workers)
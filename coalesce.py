@@ -0,0 +1,57 @@
+# Coalescing of superseded callback requests, e.g. while dragging the slider
+import collections
+import itertools
+import threading
+
+
+class Superseded(Exception):
+    """
+    A newer request for the same output arrived while this one was running.
+    """
+
+
+class Coalescer(object):
+    """
+    Tracks the latest request per key, typically (session, output), so work
+    for requests superseded by a newer one can stop early.
+
+    Requests are ordered by arrival, and by a client sequence number when one
+    is given, which also catches requests that reach the server out of order.
+    """
+
+    def __init__(self, maxkeys=10000):
+        self.maxkeys = maxkeys
+        self.dropped = 0
+        self._latest = collections.OrderedDict()  # key -> (token, max seq)
+        self._tokens = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def begin(self, key, seq=None):
+        """
+        Register a request and return its token, or None if `seq` is older
+        than one already seen for `key`.
+        """
+        with self._lock:
+            token, max_seq = self._latest.pop(key, (None, None))
+            if seq is not None and max_seq is not None and seq < max_seq:
+                self._latest[key] = (token, max_seq)
+                self.dropped += 1
+                return None
+            if seq is not None:
+                max_seq = seq if max_seq is None else max(seq, max_seq)
+            token = next(self._tokens)
+            self._latest[key] = (token, max_seq)
+            while len(self._latest) > self.maxkeys:
+                self._latest.popitem(last=False)
+            return token
+
+    def is_current(self, key, token):
+        entry = self._latest.get(key)
+        return entry is not None and entry[0] == token
+
+    def check(self, key, token):
+        # Raise Superseded when a newer request for `key` has begun
+        if not self.is_current(key, token):
+            with self._lock:
+                self.dropped += 1
+            raise Superseded(key)
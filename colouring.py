@@ -0,0 +1,77 @@
+# Values the map points can be coloured by, besides the NDVI composite
+import collections
+
+import numpy as np
+
+import dataset
+import timeseries
+
+# step: days between the DOYs the layer has values for, None for the
+# composite DOYs
+ColourLayer = collections.namedtuple(
+    'ColourLayer', ['label', 'values', 'colorscale', 'cmin', 'cmax', 'step'])
+
+NDVI_SCALE = [[0, 'white'], [1, 'green']]
+DOY_SCALE = 'Viridis'
+ANOMALY_SCALE = 'RdBu'
+
+
+def _ndvi(view, doy):
+    j = view.cube.doy_col(doy)
+    if j is None:
+        return np.full(len(view), np.nan, dtype=np.float32)
+    return view.column(j)
+
+
+def _interpolated(view, doy):
+    # Nearest day of the regular series
+    step = timeseries.INTERP_STEP
+    col = int(np.clip(round((int(doy) - 1) / step), 0, len(timeseries.regular_doys(step)) - 1))
+    return dataset.get_interpolated()[view.rows, col]
+
+
+def _harmonic(view, doy):
+    # Fitted curves evaluated on the day, from a few coefficients per point
+    coefs = dataset.get_harmonics()[view.rows]
+    return timeseries.harmonic_curves(coefs, [int(doy)])[:, 0]
+
+
+def _anomaly(view, doy):
+    # Precomputed z-scores against the class climatology of the DOY
+    j = view.cube.doy_col(doy)
+    if j is None:
+        return np.full(len(view), np.nan, dtype=np.float32)
+    return dataset.get_anomalies()[view.rows, j]
+
+
+def _phenometric(metric):
+    def values(view, doy):
+        return dataset.get_phenometrics()[metric].to_numpy(dtype=np.float32)[view.rows]
+    return values
+
+
+# Keyed by the value of the map colour dropdown. values(view, doy) gives one
+# float32 per point of the PointView, in its row order.
+LAYERS = collections.OrderedDict([
+    ('ndvi', ColourLayer('NDVI', _ndvi, NDVI_SCALE, 0, 10000, None)),
+    ('interpolated', ColourLayer('NDVI, gap-filled and interpolated', _interpolated, NDVI_SCALE, 0, 10000,
+                                 timeseries.INTERP_STEP)),
+    ('harmonic', ColourLayer('NDVI, harmonic model', _harmonic, NDVI_SCALE, 0, 10000, 1)),
+    ('anomaly', ColourLayer('NDVI anomaly (z-score)', _anomaly, ANOMALY_SCALE, -3, 3, None)),
+    ('sos', ColourLayer('Start of season (DOY)', _phenometric('sos'), DOY_SCALE, 1, 366, None)),
+    ('eos', ColourLayer('End of season (DOY)', _phenometric('eos'), DOY_SCALE, 1, 366, None)),
+    ('peak_doy', ColourLayer('Peak DOY', _phenometric('peak_doy'), DOY_SCALE, 1, 366, None)),
+    ('peak_ndvi', ColourLayer('Peak NDVI', _phenometric('peak_ndvi'), NDVI_SCALE, 0, 10000, None)),
+    ('amplitude', ColourLayer('Seasonal amplitude', _phenometric('amplitude'), NDVI_SCALE, 0, 10000,
+                              None)),
+    ('season_length', ColourLayer('Season length (days)', _phenometric('season_length'), DOY_SCALE,
+                                  0, 366, None)),
+])
+
+
+def layer_values(colour, lc, doy):
+    """
+    Values of map layer `colour` on `doy` for the points of group `lc`, in
+    the row order of dataset.get_view(lc).
+    """
+    return LAYERS[colour].values(dataset.get_view(lc), doy)
@@ -1,16 +1,5 @@
 # Controls for web app dropdowns
-import pathlib
-import pandas as pd
-from datetime import datetime
-import os
-
-# Get relative data folder
-PATH = pathlib.Path(__file__).parent
-DATA_PATH = PATH.joinpath('data').resolve()
-
-# Load datasets: Converted in external script from goeJSON to csv with x,y columns
-df = pd.read_csv(DATA_PATH.joinpath('lcDF.csv'), index_col=0, parse_dates=['variable'])
-df.columns = ['PointID', 'LC_code', 'reference_date', 'ndvi', 'lon', 'lat']
+import dataset
 
 # NLCD codes for 2011 model
 NLCD_2011 = {
@@ -36,19 +25,15 @@ NLCD_2011 = {
     '95': 'Emergent Herbaceous Wetlands',
 }
 
-# TODO: this is hardcoded for specific input date format. Needs to generalize.
-unique_dates = [str(x)[:10] for x in df.reference_date.unique()]
-
-dates_list = [datetime.strptime(x, '%Y-%m-%d') for x in unique_dates]
-
-# Note: this starts with DOY = 1.
-DOYLIST = [x.timetuple().tm_yday for x in dates_list]
-# DOYLIST = [str(x.timetuple().tm_yday) for x in dates_list]
 
-DOYDICT = dict(zip(DOYLIST, unique_dates))
+# DOYLIST, DOYDICT, DOY2DATETIMEDICT and DATETIME2DOYDICT are built by
+# dataset.doy_tables from the same frame the apps display, the first time one
+# of them is imported.
+def __getattr__(name):
+    if name in dataset.DoyTables._fields:
+        return getattr(dataset.doy_tables(), name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
-DOY2DATETIMEDICT = dict(zip(DOYLIST, df.reference_date.unique()))
-DATETIME2DOYDICT = dict(zip(df.reference_date.unique(), DOYLIST))
 
 # # For testing
 # lc_options = [
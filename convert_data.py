@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+One-shot converter from the long-format csv to a parquet dataset partitioned
+by LC_code, which dataset.load_phenology picks up when present. With --cube it
+also writes the memory-mapped NDVI cube the app workers open at startup.
+
+    python convert_data.py lcDF_conus
+    python convert_data.py lcDF_conus --cube
+    python convert_data.py lcDF_conus --benchmark
+    python convert_data.py lcDF_conus --memory
+    python convert_data.py --synthetic 300000 --benchmark
+"""
+import argparse
+import multiprocessing
+import resource
+import shutil
+import sys
+import time
+
+import dataset
+
+
+def convert(name):
+    df = dataset.read_csv(name)
+    dest = dataset.parquet_path(name)
+    if dest.exists():
+        shutil.rmtree(dest)
+    df.to_parquet(dest, partition_cols=['LC_code'], index=False)
+    # A cube built from the previous table is stale now (--cube rebuilds it)
+    if dataset.cube_path(name).exists():
+        shutil.rmtree(dataset.cube_path(name))
+    return dest
+
+
+def _reset_peak_rss():
+    # Linux carries the parent's peak RSS over fork and exec, which would
+    # count the csv convert() read; writing 5 to clear_refs resets it
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss():
+    # Peak RSS in kilobytes since _reset_peak_rss, from /proc when available
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak //= 1024
+    return peak
+
+
+def _timed_load(loader, name, queue):
+    _reset_peak_rss()
+    start = time.perf_counter()
+    df = loader(name)
+    elapsed = time.perf_counter() - start
+    queue.put((elapsed, _peak_rss(), len(df)))
+
+
+def benchmark(name):
+    # Each loader runs in a fresh process so peak RSS is not shared
+    ctx = multiprocessing.get_context('spawn')
+    for label, loader in [('csv', dataset.read_csv), ('parquet', dataset.read_parquet)]:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_timed_load, args=(loader, name, queue))
+        proc.start()
+        elapsed, peak, rows = queue.get()
+        proc.join()
+        print('{:8s} {:8.2f} s  {:8.1f} MB peak RSS  {} rows'.format(
+            label, elapsed, peak / 1024, rows))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('name', nargs='?', default=None,
+                        help='dataset name in the data folder, without extension '
+                             '(default: lcDF_conus, or synthetic_<POINTS> with --synthetic)')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='compare load time and peak RSS of the csv and parquet paths')
+    parser.add_argument('--cube', action='store_true',
+                        help='also write the memory-mapped cube (dataset.build_cube)')
+    parser.add_argument('--memory', action='store_true',
+                        help='report bytes per column before and after dataset.compact')
+    parser.add_argument('--synthetic', type=int, metavar='POINTS',
+                        help='first write a synthetic csv of POINTS points as a new dataset')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        import benchmarks
+        args.name = args.name or 'synthetic_{}'.format(args.synthetic)
+        if dataset.csv_path(args.name).exists():
+            parser.error('{} exists; --synthetic only writes new datasets'.format(
+                dataset.csv_path(args.name)))
+        print('Wrote', benchmarks.write_synthetic_csv(args.name, args.synthetic))
+    args.name = args.name or 'lcDF_conus'
+    print('Wrote', convert(args.name))
+    if args.cube:
+        print('Wrote', dataset.build_cube(args.name))
+    if args.benchmark:
+        benchmark(args.name)
+    if args.memory:
+        raw = dataset.load_phenology(args.name)
+        print(dataset.memory_report(raw, dataset.compact(raw)))
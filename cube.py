@@ -0,0 +1,229 @@
+# Dense point x DOY NDVI cube, the in-memory form of the phenology dataset
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# Arrays stored by NDVICube.save, one .npy file each
+ARRAYS = ['lc', 'lon', 'lat', 'doys', 'ndvi']
+
+
+class NDVICube(object):
+    """
+    NDVI as a (points x DOYs) float32 array, NaN where a composite is
+    missing, with per-point LC_code, lon and lat side arrays.
+
+    Points are ordered by (LC_code, PointID), so the points of a class are a
+    row slice and a DOY is a column.
+    """
+
+    def __init__(self, point_ids, lc, lon, lat, doys, ndvi):
+        # PointIDs as strings whatever the source, the way save() stores them
+        # and the map sends them back
+        self.point_ids = pd.Index(np.asarray(point_ids).astype(str))
+        self.lc = np.asarray(lc, dtype=np.int16)
+        self.lon = np.asarray(lon, dtype=np.float32)
+        self.lat = np.asarray(lat, dtype=np.float32)
+        self.doys = np.asarray(doys, dtype=np.int16)
+        self.ndvi = np.asarray(ndvi, dtype=np.float32)
+        self._doy_pos = {doy: j for j, doy in enumerate(self.doys.tolist())}
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        Build the cube from a long frame with dataset.SCHEMA columns.
+        """
+        codes = df['PointID'].cat.codes.to_numpy()
+        n_points = len(df['PointID'].cat.categories)
+
+        # Per-point side arrays (every row of a point carries the same values)
+        lc = np.zeros(n_points, dtype=np.int16)
+        lon = np.zeros(n_points, dtype=np.float32)
+        lat = np.zeros(n_points, dtype=np.float32)
+        lc[codes] = df['LC_code'].astype('int16').to_numpy()
+        lon[codes] = df['lon'].to_numpy()
+        lat[codes] = df['lat'].to_numpy()
+
+        # Row of each point once sorted by class, ties kept in PointID order
+        order = np.argsort(lc, kind='stable')
+        rank = np.empty(n_points, dtype=np.int64)
+        rank[order] = np.arange(n_points)
+
+        doy = df['doy'].to_numpy()
+        doys = np.unique(doy)
+        ndvi = np.full((n_points, len(doys)), np.nan, dtype=np.float32)
+        ndvi[rank[codes], np.searchsorted(doys, doy)] = df['ndvi'].to_numpy()
+
+        return cls(df['PointID'].cat.categories[order], lc[order], lon[order],
+                   lat[order], doys, ndvi)
+
+    @classmethod
+    def open(cls, path):
+        """
+        Map a cube written by save() read-only. Workers opening the same
+        directory share its pages through the OS page cache.
+        """
+        arrays = {key: np.load(path.joinpath(key + '.npy'), mmap_mode='r')
+                  for key in ARRAYS}
+        point_ids = np.load(path.joinpath('point_ids.npy'))
+        return cls(point_ids, **arrays)
+
+    def save(self, path, extra=None):
+        # Written next to `path` first so open() never sees a partial cube.
+        # `extra` maps names to more arrays stored with it as <name>.npy.
+        tmp = path.with_name(path.name + '.tmp')
+        if tmp.exists():
+            shutil.rmtree(tmp)
+        tmp.mkdir(parents=True)
+        for key in ARRAYS:
+            np.save(tmp.joinpath(key + '.npy'), getattr(self, key))
+        np.save(tmp.joinpath('point_ids.npy'), self.point_ids.to_numpy(dtype=str))
+        for key, array in (extra or {}).items():
+            np.save(tmp.joinpath(key + '.npy'), array)
+        if path.exists():
+            shutil.rmtree(path)
+        tmp.rename(path)
+
+    @property
+    def missing(self):
+        return np.isnan(self.ndvi)
+
+    def lc_slice(self, lc):
+        # Rows of one land cover class
+        lc = int(lc)
+        return slice(np.searchsorted(self.lc, lc, 'left'),
+                     np.searchsorted(self.lc, lc, 'right'))
+
+    def doy_col(self, doy):
+        # Column of a composite DOY, or None if there is no such composite
+        return self._doy_pos.get(int(doy))
+
+    def row(self, point_id):
+        # Row of a PointID label, or -1
+        return self.point_ids.get_indexer([str(point_id)])[0]
+
+    def series(self, point_id):
+        """
+        (doy, ndvi) of one point without its missing composites.
+        """
+        i = self.row(point_id)
+        if i < 0:
+            return self.doys[:0], self.ndvi[0, :0]
+        values = self.ndvi[i]
+        keep = ~np.isnan(values)
+        return self.doys[keep], values[keep]
+
+    def doy_frame(self, lc, doy, dropna=True):
+        """
+        Points of class `lc` on `doy`, as a frame with PointID, lon, lat and
+        ndvi columns for the map. With dropna=False points missing that
+        composite are kept with a NaN ndvi, so every DOY of a class gives the
+        same points in the same order.
+        """
+        return self.frame(self.lc_slice(lc), doy, dropna)
+
+    def frame(self, rows, doy, dropna=True):
+        # doy_frame of any rows, a slice or an index array
+        j = self.doy_col(doy)
+        if j is not None:
+            values = self.ndvi[rows, j]
+        else:
+            # No composite on that day: every point is missing it
+            values = np.full(len(self.lon[rows]), np.nan, dtype=np.float32)
+        if not dropna:
+            return pd.DataFrame({
+                'PointID': self.point_ids[rows],
+                'lon': self.lon[rows],
+                'lat': self.lat[rows],
+                'ndvi': values,
+            })
+        keep = ~np.isnan(values)
+        return pd.DataFrame({
+            'PointID': self.point_ids[rows][keep],
+            'lon': self.lon[rows][keep],
+            'lat': self.lat[rows][keep],
+            'ndvi': values[keep].astype(np.int16),
+        })
+
+    def to_long(self, lc=None, rows=None):
+        """
+        Long frame with dataset.SCHEMA columns, for all points, one class or
+        the given rows, in row then doy order.
+        """
+        if rows is None:
+            rows = slice(None) if lc is None else self.lc_slice(lc)
+        point_rows = np.arange(len(self.point_ids))[rows]
+        values = self.ndvi[rows].ravel()
+        keep = ~np.isnan(values)
+
+        n_doys = len(self.doys)
+        point_rows = np.repeat(point_rows, n_doys)[keep]
+        return pd.DataFrame({
+            'PointID': pd.Categorical.from_codes(point_rows, categories=self.point_ids),
+            'LC_code': pd.Categorical(self.lc[point_rows], categories=np.unique(self.lc)),
+            'doy': np.tile(self.doys, len(values) // max(n_doys, 1))[keep],
+            'ndvi': values[keep].astype(np.int16),
+            'lon': self.lon[point_rows],
+            'lat': self.lat[point_rows],
+        })
+
+
+def _readonly(arr):
+    view = arr.view()
+    view.flags.writeable = False
+    return view
+
+
+class PointView(object):
+    """
+    A group of points of a cube, `rows` being a slice or an index array,
+    with read-only arrays of its rows.
+    dataset.get_view shares one instance per group between all callbacks, so
+    none of them should modify what it returns.
+
+    Arrays of a slice are views of the cube. Those of an index array are
+    gathered on each access and not kept, so a view does not hold a private
+    copy of the (possibly memory-mapped) cube; use column() for one DOY.
+    """
+
+    def __init__(self, cube, rows):
+        self.cube = cube
+        self.rows = rows
+        self.doys = cube.doys
+        self._n_points = len(cube.lc[rows])
+
+    def __len__(self):
+        return self._n_points
+
+    @property
+    def point_ids(self):
+        return self.cube.point_ids[self.rows]
+
+    @property
+    def lon(self):
+        return _readonly(self.cube.lon[self.rows])
+
+    @property
+    def lat(self):
+        return _readonly(self.cube.lat[self.rows])
+
+    @property
+    def ndvi(self):
+        return _readonly(self.cube.ndvi[self.rows])
+
+    def column(self, j):
+        # NDVI of column j of the cube for the points of the view
+        return _readonly(self.cube.ndvi[self.rows, j])
+
+    def doy_frame(self, doy, dropna=True):
+        return self.cube.frame(self.rows, doy, dropna=dropna)
+
+
+class ClassView(PointView):
+    """
+    One land cover class, a row slice of the cube.
+    """
+
+    def __init__(self, cube, lc):
+        super(ClassView, self).__init__(cube, cube.lc_slice(lc))
+        self.lc = int(lc)
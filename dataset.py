@@ -0,0 +1,541 @@
+# Loading of the long-format phenology table shared by the apps and controls
+import collections
+import functools
+import os
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+from cube import ClassView, NDVICube, PointView
+from indexes import PartitionIndex
+import climatology
+import clustering
+import phenometrics
+import timeseries
+
+# Get relative data folder
+PATH = pathlib.Path(__file__).parent
+DATA_PATH = PATH.joinpath('data').resolve()
+
+# Column names used throughout the apps (the csv carries the melted names)
+COLUMNS = ['PointID', 'LC_code', 'reference_date', 'ndvi', 'lon', 'lat']
+
+# Dataset shown by the apps. NOTE: lcDF for DRB, lcDF_conus for conus
+DATASET = os.environ.get('PHENOLOGY_DATASET', 'lcDF_conus')
+
+# Columns of the frame served to the apps, see compact()
+SCHEMA = {
+    'PointID': 'category',   # integer codes, labels in .cat.categories
+    'LC_code': 'category',
+    'doy': 'int16',          # composite DOY, replaces reference_date
+    'ndvi': 'int16',         # 0-10000
+    'lon': 'float32',
+    'lat': 'float32',
+}
+
+# Groups of points named CLUSTER_PREFIX + n are the points of cluster n of
+# get_clusters, see get_view; other group names are land cover classes
+CLUSTER_PREFIX = 'c'
+
+DoyTables = collections.namedtuple(
+    'DoyTables', ['DOYLIST', 'DOYDICT', 'DOY2DATETIMEDICT', 'DATETIME2DOYDICT'])
+
+
+def csv_path(name):
+    return DATA_PATH.joinpath(name + '.csv')
+
+
+def parquet_path(name):
+    # Directory written by convert_data.py, one sub folder per LC_code
+    return DATA_PATH.joinpath(name + '.parquet')
+
+
+def cube_path(name):
+    # Directory of .npy files written by build_cube
+    return DATA_PATH.joinpath(name + '.cube')
+
+
+def cube_is_current(name):
+    """
+    Whether the cube of a dataset exists and was built after its table (the
+    parquet copy, else the csv) was last written.
+    """
+    path = cube_path(name)
+    if not path.exists():
+        return False
+    for source in [parquet_path(name), csv_path(name)]:
+        if source.exists():
+            return path.stat().st_mtime_ns >= source.stat().st_mtime_ns
+    return True
+
+
+def derived_path(filename, name=None):
+    # Products derived from one version of a dataset, rebuilt when it changes
+    name = name or DATASET
+    return DATA_PATH.joinpath('derived', dataset_version(name), filename)
+
+
+def write_table(table, path):
+    """
+    Write `table` to the parquet file `path` through a temporary file, so
+    readers never see a partial file.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.tmp')
+    table.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+    return path
+
+
+def write_array(array, path):
+    """
+    Write `array` to the .npy file `path` through a temporary file, like
+    write_table.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+    return path
+
+
+def smoothed_filename(window=None, order=None):
+    return 'smoothed_w{}_o{}.npy'.format(
+        window or timeseries.SAVGOL_WINDOW,
+        timeseries.SAVGOL_ORDER if order is None else order)
+
+
+def interpolated_filename(method='linear', step=None):
+    return 'interpolated_{}_s{}.npy'.format(method, step or timeseries.INTERP_STEP)
+
+
+def harmonics_filename(n_harmonics=None):
+    return 'harmonics_k{}.npy'.format(n_harmonics or timeseries.N_HARMONICS)
+
+
+def centroids_filename(n_clusters=None):
+    return 'centroids_k{}.npy'.format(n_clusters or clustering.N_CLUSTERS)
+
+
+def clusters_filename(n_clusters=None):
+    return 'clusters_k{}.npy'.format(n_clusters or clustering.N_CLUSTERS)
+
+
+def anomalies_filename():
+    return 'anomalies.npy'
+
+
+def phenometrics_filename():
+    # A parquet file, or a folder of parquet parts written by derive.py
+    return 'phenometrics_w{}_o{}_t{}.parquet'.format(
+        timeseries.SAVGOL_WINDOW, timeseries.SAVGOL_ORDER, phenometrics.THRESHOLD)
+
+
+def read_csv(name):
+    # Load datasets: Converted in external script from goeJSON to csv with x,y columns
+    df = pd.read_csv(csv_path(name), index_col=0, parse_dates=['variable'])
+    df.columns = COLUMNS
+    return df
+
+
+def read_parquet(name, columns=None, lc_codes=None):
+    """
+    Read only the requested columns and LC_code partitions of a converted
+    dataset.
+    """
+    columns = list(COLUMNS if columns is None else columns)
+    filters = None
+    if lc_codes is not None:
+        filters = [('LC_code', 'in', [int(x) for x in lc_codes])]
+
+    # The partition key is stored in the directory names, so it is only
+    # requested from pyarrow when the caller wants it back.
+    df = pd.read_parquet(parquet_path(name), columns=columns, filters=filters)
+    if 'LC_code' in df:
+        # Partition keys come back as a dictionary column; keep the int codes
+        # the callbacks compare against.
+        df['LC_code'] = df['LC_code'].astype('int64')
+    return df[columns]
+
+
+def load_phenology(name='lcDF_conus', columns=None, lc_codes=None):
+    """
+    Load a phenology table, preferring the columnar copy written by
+    convert_data.py and falling back to parsing the csv.
+    """
+    if parquet_path(name).exists():
+        return read_parquet(name, columns=columns, lc_codes=lc_codes)
+
+    df = read_csv(name)
+    if lc_codes is not None:
+        df = df[df['LC_code'].isin([int(x) for x in lc_codes])]
+    if columns is not None:
+        df = df[list(columns)]
+    return df
+
+
+def compact(df):
+    """
+    Apply SCHEMA to a table as read from disk. Rows without an NDVI value are
+    dropped, the same as a composite missing from the csv.
+    """
+    df = df.dropna(subset=['ndvi'])
+    out = pd.DataFrame({
+        'PointID': df['PointID'],
+        'LC_code': df['LC_code'].astype('int16'),
+        'doy': df['reference_date'].dt.dayofyear,
+        'ndvi': df['ndvi'].round(),
+        'lon': df['lon'],
+        'lat': df['lat'],
+    }).astype(SCHEMA)
+    return out.reset_index(drop=True)
+
+
+def memory_report(raw, compacted):
+    """
+    Bytes per column before and after compact(), as a frame.
+    """
+    before = raw.memory_usage(deep=True, index=False)
+    after = compacted.memory_usage(deep=True, index=False)
+    # reference_date is replaced by doy
+    before = before.rename({'reference_date': 'doy'})
+    report = pd.DataFrame({'before': before, 'after': after})
+    report.loc['total'] = report.sum()
+    report['ratio'] = (report['before'] / report['after']).round(1)
+    return report
+
+
+def build_cube(name):
+    """
+    Parse a dataset and write it as a memory-mappable cube, which _load then
+    maps instead of parsing the table.
+    """
+    cube, dates = _parse(name)
+    # The dates go in with the cube, so no worker sees it without them
+    cube.save(cube_path(name), extra={'dates': dates.to_numpy(dtype='datetime64[D]')})
+    return cube_path(name)
+
+
+def get_cube(name=None):
+    """
+    The active dataset as an NDVICube, loaded on first use and shared by every
+    caller. Treat it as read-only.
+    """
+    return _load(name or DATASET)[0]
+
+
+def get_class_view(lc, name=None):
+    """
+    ClassView of one land cover class, built once per (dataset version,
+    class) and shared by reference. Treat it as read-only.
+    """
+    name = name or DATASET
+    return _class_view(dataset_version(name), name, int(lc))
+
+
+def get_smoothed(window=None, order=None, name=None):
+    """
+    Savitzky-Golay smoothed NDVI of every point, rows and columns aligned
+    with the cube, computed once per dataset version and parameters unless
+    derive.py has written it. Defaults to timeseries.SAVGOL_WINDOW and
+    SAVGOL_ORDER. Treat it as read-only.
+    """
+    name = name or DATASET
+    return _smoothed(dataset_version(name), name,
+                     window or timeseries.SAVGOL_WINDOW,
+                     timeseries.SAVGOL_ORDER if order is None else order)
+
+
+def get_interpolated(method='linear', step=None, name=None):
+    """
+    Gap-filled NDVI of every point every `step` days (default
+    timeseries.INTERP_STEP) on timeseries.regular_doys, rows aligned with the
+    cube. Computed once per dataset version and parameters unless derive.py
+    has written it, which is worth doing for large datasets: at one day steps
+    it is 16 times the size of the cube. Treat it as read-only.
+    """
+    name = name or DATASET
+    return _interpolated(dataset_version(name), name, method, step or timeseries.INTERP_STEP)
+
+
+def get_harmonics(n_harmonics=None, name=None):
+    """
+    Harmonic regression coefficients of every point (timeseries.harmonic_fit,
+    default timeseries.N_HARMONICS harmonics), rows aligned with the cube.
+    timeseries.harmonic_curves evaluates them on any DOY. Computed once per
+    dataset version unless derive.py has written them. Treat as read-only.
+    """
+    name = name or DATASET
+    return _harmonics(dataset_version(name), name, n_harmonics or timeseries.N_HARMONICS)
+
+
+def get_phenometrics(name=None):
+    """
+    Table of phenometrics.METRICS per point, rows in cube order, from the
+    default smoothed curves. Read from the derived folder of the dataset
+    version when present, else computed on all cores and written there.
+    Treat it as read-only.
+    """
+    name = name or DATASET
+    return _phenometrics(dataset_version(name), name)
+
+
+def get_climatology(name=None):
+    """
+    climatology.STATS of each (LC_code, doy) as a table, see
+    climatology.climatology. Read from the derived folder of the dataset
+    version when present, else computed and written there. Treat it as
+    read-only.
+    """
+    name = name or DATASET
+    return _climatology(dataset_version(name), name)
+
+
+def get_anomalies(name=None):
+    """
+    z-score of every NDVI value of the cube against the climatology of its
+    class and DOY, as a (points x DOYs) float32 array aligned with the cube.
+    Computed once per dataset version unless derive.py has written it. Treat
+    it as read-only.
+    """
+    name = name or DATASET
+    return _anomalies(dataset_version(name), name)
+
+
+def get_centroids(n_clusters=None, name=None):
+    """
+    (clusters x DOYs) centroid curves of mini-batch k-means over the default
+    smoothed curves, clustering.N_CLUSTERS of them by default. Read from the
+    derived folder of the dataset version when present, else fitted and
+    written there.
+    """
+    name = name or DATASET
+    return _centroids(dataset_version(name), name, n_clusters or clustering.N_CLUSTERS)
+
+
+def get_clusters(n_clusters=None, name=None):
+    """
+    Cluster of every point (row of the cube) for get_centroids, -1 for points
+    without data. Read from the derived folder of the dataset version when
+    present, else assigned and written there. Treat it as read-only.
+    """
+    name = name or DATASET
+    return _clusters(dataset_version(name), name, n_clusters or clustering.N_CLUSTERS)
+
+
+def get_view(group, name=None):
+    """
+    PointView of a group of points, shared like get_class_view: a land cover
+    class code, or CLUSTER_PREFIX and the number of a cluster of get_clusters.
+    """
+    group = str(group)
+    if group.startswith(CLUSTER_PREFIX):
+        name = name or DATASET
+        return _cluster_view(dataset_version(name), name, clustering.N_CLUSTERS,
+                             int(group[len(CLUSTER_PREFIX):]))
+    return get_class_view(group, name)
+
+
+def get_df(name=None):
+    """
+    The active dataset as a long frame, derived from the cube on first use.
+    Treat it as read-only.
+    """
+    return get_index(name).df
+
+
+def get_index(name=None):
+    """
+    PartitionIndex over the frame returned by get_df.
+    """
+    return _index(name or DATASET)
+
+
+def dataset_version(name=None):
+    """
+    Key identifying the loaded data, for caches of derived results. Changes
+    when the files the dataset was loaded from are rebuilt.
+    """
+    return _version(name or DATASET)
+
+
+def doy_tables(name=None):
+    """
+    DOY lookups built from the composite dates of the same dataset the apps
+    display.
+    """
+    return _doy_tables(name or DATASET)
+
+
+def _parse(name):
+    raw = load_phenology(name)
+    # The composite dates are kept aside since the cube only carries DOYs
+    dates = pd.DatetimeIndex(raw['reference_date'].unique()).sort_values()
+    return NDVICube.from_frame(compact(raw)), dates
+
+
+@functools.lru_cache(maxsize=None)
+def _load(name):
+    path = cube_path(name)
+    if cube_is_current(name):
+        # Read-only mapping shared by all workers serving the same dataset.
+        # A cube older than its table is ignored until rebuilt.
+        dates = pd.DatetimeIndex(np.load(path.joinpath('dates.npy')))
+        return NDVICube.open(path), dates
+    return _parse(name)
+
+
+# Views are cheap to rebuild; the bounds keep names passed in from requests
+# from growing the caches without limit
+@functools.lru_cache(maxsize=64)
+def _class_view(version, name, lc):
+    return ClassView(_load(name)[0], lc)
+
+
+@functools.lru_cache(maxsize=4)
+def _smoothed(version, name, window, order):
+    path = derived_path(smoothed_filename(window, order), name)
+    if path.exists():
+        # Written by derive.py
+        return np.load(path, mmap_mode='r')
+    cube = _load(name)[0]
+    smoothed = timeseries.savgol(cube.ndvi, cube.doys, window, order,
+                                 workers=os.cpu_count())
+    smoothed.flags.writeable = False
+    return smoothed
+
+
+@functools.lru_cache(maxsize=2)
+def _interpolated(version, name, method, step):
+    path = derived_path(interpolated_filename(method, step), name)
+    if path.exists():
+        # Written by derive.py
+        return np.load(path, mmap_mode='r')
+    cube = _load(name)[0]
+    dense = timeseries.resample(cube.ndvi, cube.doys, timeseries.regular_doys(step),
+                                method, workers=os.cpu_count())
+    dense.flags.writeable = False
+    return dense
+
+
+@functools.lru_cache(maxsize=None)
+def _harmonics(version, name, n_harmonics):
+    path = derived_path(harmonics_filename(n_harmonics), name)
+    if path.exists():
+        # Written by derive.py
+        return np.load(path)
+    cube = _load(name)[0]
+    coefs = timeseries.harmonic_fit(cube.ndvi, cube.doys, n_harmonics, workers=os.cpu_count())
+    coefs.flags.writeable = False
+    return coefs
+
+
+@functools.lru_cache(maxsize=None)
+def _phenometrics(version, name):
+    path = derived_path(phenometrics_filename(), name)
+    if path.exists():
+        return pd.read_parquet(path)
+    table = phenometrics.phenometrics_table(_load(name)[0], get_smoothed(name=name))
+    try:
+        write_table(table, path)
+    except OSError:
+        # Read-only data folder: keep the table for this process only
+        pass
+    return table
+
+
+@functools.lru_cache(maxsize=None)
+def _climatology(version, name):
+    path = derived_path('climatology.parquet', name)
+    if path.exists():
+        return pd.read_parquet(path)
+    table = climatology.climatology(_load(name)[0])
+    try:
+        write_table(table, path)
+    except OSError:
+        # Read-only data folder: keep the table for this process only
+        pass
+    return table
+
+
+@functools.lru_cache(maxsize=None)
+def _anomalies(version, name):
+    path = derived_path(anomalies_filename(), name)
+    if path.exists():
+        # Written by derive.py
+        return np.load(path, mmap_mode='r')
+    cube = _load(name)[0]
+    z = climatology.anomalies(cube.ndvi, cube.lc, get_climatology(name), workers=os.cpu_count())
+    z.flags.writeable = False
+    return z
+
+
+@functools.lru_cache(maxsize=None)
+def _centroids(version, name, n_clusters):
+    path = derived_path(centroids_filename(n_clusters), name)
+    if path.exists():
+        return np.load(path)
+    centroids = clustering.fit(get_smoothed(name=name), n_clusters)
+    try:
+        write_array(centroids, path)
+    except OSError:
+        # Read-only data folder: keep the centroids for this process only
+        pass
+    return centroids
+
+
+@functools.lru_cache(maxsize=None)
+def _clusters(version, name, n_clusters):
+    path = derived_path(clusters_filename(n_clusters), name)
+    if path.exists():
+        # Written by derive.py or an earlier run
+        return np.load(path, mmap_mode='r')
+    labels = clustering.assign(get_smoothed(name=name), _centroids(version, name, n_clusters),
+                               workers=os.cpu_count())
+    labels.flags.writeable = False
+    try:
+        write_array(labels, path)
+    except OSError:
+        # Read-only data folder: keep the labels for this process only
+        pass
+    return labels
+
+
+@functools.lru_cache(maxsize=64)
+def _cluster_view(version, name, n_clusters, cluster):
+    # Rows in cube order; the view gathers them from the shared cube on use
+    labels = _clusters(version, name, n_clusters)
+    return PointView(_load(name)[0], np.flatnonzero(np.asarray(labels) == cluster))
+
+
+@functools.lru_cache(maxsize=None)
+def _version(name):
+    # Same precedence as _load and load_phenology
+    paths = [parquet_path(name), csv_path(name)]
+    if cube_is_current(name):
+        paths.insert(0, cube_path(name))
+    for path in paths:
+        if path.exists():
+            return '{}-{}'.format(name, path.stat().st_mtime_ns)
+    return name
+
+
+@functools.lru_cache(maxsize=None)
+def _index(name):
+    return PartitionIndex(_load(name)[0].to_long())
+
+
+@functools.lru_cache(maxsize=None)
+def _doy_tables(name):
+    dates = _load(name)[1]
+
+    # Note: this starts with DOY = 1.
+    doys = dates.dayofyear.tolist()
+    return DoyTables(
+        DOYLIST=doys,
+        DOYDICT=dict(zip(doys, dates.strftime('%Y-%m-%d'))),
+        DOY2DATETIMEDICT=dict(zip(doys, dates)),
+        DATETIME2DOYDICT=dict(zip(dates, doys)),
+    )
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+Offline computation of the derived products the apps otherwise build on their
+first request. Points are split into chunks processed in a pool of worker
+processes, and the results are written to the derived folder of the dataset
+version (dataset.derived_path), where the apps load them from. Finished
+chunks are kept, so an interrupted run resumes where it stopped.
+
+    python derive.py lcDF_conus
+    python derive.py lcDF_conus --products phenometrics --workers 8
+"""
+import argparse
+import collections
+from concurrent import futures
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+import climatology
+import clustering
+import dataset
+import phenometrics
+import timeseries
+
+CHUNK_POINTS = 50000
+
+
+def _smoothed_chunk(name, cube, rows):
+    return timeseries.savgol(cube.ndvi[rows], cube.doys)
+
+
+def _phenometrics_chunk(name, cube, rows):
+    smoothed = timeseries.savgol(cube.ndvi[rows], cube.doys)
+    return phenometrics.phenometrics_table(cube, smoothed, rows, workers=1)
+
+
+def _interpolated_chunk(name, cube, rows):
+    return timeseries.resample(cube.ndvi[rows], cube.doys, timeseries.regular_doys())
+
+
+def _harmonics_chunk(name, cube, rows):
+    return timeseries.harmonic_fit(cube.ndvi[rows], cube.doys)
+
+
+def _anomalies_chunk(name, cube, rows):
+    return climatology.anomalies(cube.ndvi[rows], cube.lc[rows], dataset.get_climatology(name))
+
+
+def _clusters_chunk(name, cube, rows):
+    smoothed = timeseries.savgol(cube.ndvi[rows], cube.doys)
+    return clustering.assign(smoothed, dataset.get_centroids(name=name))
+
+
+# Product -> (function giving its file name in the derived folder, function
+# of (dataset name, cube, row slice) giving the rows of an array or a table)
+PRODUCTS = collections.OrderedDict([
+    ('smoothed', (dataset.smoothed_filename, _smoothed_chunk)),
+    ('phenometrics', (dataset.phenometrics_filename, _phenometrics_chunk)),
+    ('interpolated', (dataset.interpolated_filename, _interpolated_chunk)),
+    ('harmonics', (dataset.harmonics_filename, _harmonics_chunk)),
+    ('anomalies', (dataset.anomalies_filename, _anomalies_chunk)),
+    ('clusters', (dataset.clusters_filename, _clusters_chunk)),
+])
+
+# Whole-dataset results the chunks of a product share, computed first and
+# written to the derived folder where the workers read them
+PREREQUISITES = {
+    'anomalies': dataset.get_climatology,
+    'clusters': dataset.get_centroids,
+}
+
+
+def parts_path(dest):
+    # Chunks of a product being built; renamed or merged into `dest` at the end
+    return dest.with_name(dest.name + '.parts')
+
+
+def _part(parts, start, stop, ext):
+    # Zero padded so the parts sort in row order
+    return parts.joinpath('part-{:010d}-{:010d}{}'.format(start, stop, ext))
+
+
+def _part_rows(parts):
+    # (start, stop) of the parts written so far, in row order
+    rows = []
+    for path in parts.glob('part-*'):
+        if path.suffix in ('.npy', '.parquet'):
+            start, stop = path.stem.split('-')[1:]
+            rows.append((int(start), int(stop)))
+    return sorted(rows)
+
+
+def run_chunk(name, product, parts, start, stop):
+    """
+    Compute rows start:stop of `product` and write them as one part.
+    """
+    cube = dataset.get_cube(name)
+    result = PRODUCTS[product][1](name, cube, slice(start, stop))
+    if isinstance(result, pd.DataFrame):
+        dataset.write_table(result, _part(parts, start, stop, '.parquet'))
+    else:
+        dataset.write_array(result, _part(parts, start, stop, '.npy'))
+    return stop - start
+
+
+def finish(parts, dest, n_points):
+    """
+    Turn the parts of a product into `dest`: array parts are merged into one
+    .npy file, table parts become a folder that pandas reads as one table.
+    The parts must cover the `n_points` rows of the cube exactly once.
+    """
+    rows = _part_rows(parts)
+    if [0] + [stop for start, stop in rows] != [start for start, stop in rows] + [n_points]:
+        raise ValueError('Parts in {} do not cover rows 0:{} of the cube'.format(parts, n_points))
+
+    arrays = sorted(parts.glob('part-*.npy'))
+    if not arrays:
+        parts.rename(dest)
+        return dest
+
+    blocks = [np.load(path, mmap_mode='r') for path in arrays]
+    total = sum(len(b) for b in blocks)
+    if total != n_points:
+        raise ValueError('Parts in {} hold {} rows, the cube has {}'.format(parts, total, n_points))
+    tmp = dest.with_name(dest.name + '.tmp')
+    out = np.lib.format.open_memmap(
+        tmp, mode='w+', dtype=blocks[0].dtype, shape=(total,) + blocks[0].shape[1:])
+    start = 0
+    for block in blocks:
+        out[start:start + len(block)] = block
+        start += len(block)
+    out.flush()
+    del out
+    os.replace(tmp, dest)
+    shutil.rmtree(parts)
+    return dest
+
+
+def _progress(done, total, points):
+    sys.stderr.write('\r{:>6d}/{} chunks  {:>12d} points'.format(done, total, points))
+    sys.stderr.flush()
+
+
+def derive(name, products, workers=None, chunk_points=CHUNK_POINTS):
+    if not dataset.cube_is_current(name):
+        # Workers map the cube instead of each parsing the table
+        print('Building', dataset.build_cube(name))
+    n_points = len(dataset.get_cube(name).point_ids)
+    for product in products:
+        if product in PREREQUISITES:
+            PREREQUISITES[product](name=name)
+
+    tasks, targets, chunks = [], [], 0
+    for product in products:
+        dest = dataset.derived_path(PRODUCTS[product][0](), name)
+        if dest.exists():
+            print('Up to date', dest)
+            continue
+        parts = parts_path(dest)
+        parts.mkdir(parents=True, exist_ok=True)
+        targets.append((parts, dest))
+        planned = [(start, min(start + chunk_points, n_points))
+                   for start in range(0, n_points, chunk_points)]
+        done = _part_rows(parts)
+        if not set(done) <= set(planned):
+            # Left by a run with another chunk size (or another cube)
+            size = max(stop - start for start, stop in done)
+            raise ValueError('{} holds chunks of {} points; resume with --chunk {} or delete it'
+                             .format(parts, size, size))
+        chunks += len(planned)
+        tasks += [(name, product, parts, start, stop)
+                  for start, stop in planned if (start, stop) not in done]
+
+    if tasks:
+        if chunks > len(tasks):
+            print('Resuming, {} chunks already done'.format(chunks - len(tasks)))
+        points = 0
+        with futures.ProcessPoolExecutor(workers or os.cpu_count()) as pool:
+            pending = [pool.submit(run_chunk, *task) for task in tasks]
+            for done, future in enumerate(futures.as_completed(pending), 1):
+                points += future.result()
+                _progress(done, len(pending), points)
+        sys.stderr.write('\n')
+
+    for parts, dest in targets:
+        print('Wrote', finish(parts, dest, n_points))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('name', nargs='?', default=dataset.DATASET,
+                        help='dataset name in the data folder, without extension')
+    parser.add_argument('--products', nargs='+', choices=list(PRODUCTS), default=list(PRODUCTS),
+                        help='products to compute (default: all)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes (default: number of cores)')
+    parser.add_argument('--chunk', type=int, default=CHUNK_POINTS,
+                        help='points per chunk (default: %(default)s)')
+    args = parser.parse_args()
+
+    derive(args.name, args.products, args.workers, args.chunk)
@@ -0,0 +1,76 @@
+# Compact encodings of NumPy data for figure payloads
+import base64
+import functools
+import importlib
+import os
+import pathlib
+import re
+
+import numpy as np
+
+# First plotly.js release that decodes {'dtype', 'bdata'} typed arrays
+TYPED_ARRAYS_PLOTLY_JS = (2, 28)
+
+# NumPy dtypes plotly.js decodes from base64 typed arrays
+TYPED_ARRAY_DTYPES = {
+    np.dtype('float64'): 'f8',
+    np.dtype('float32'): 'f4',
+    np.dtype('int32'): 'i4',
+    np.dtype('uint32'): 'u4',
+    np.dtype('int16'): 'i2',
+    np.dtype('uint16'): 'u2',
+    np.dtype('int8'): 'i1',
+    np.dtype('uint8'): 'u1',
+}
+
+
+def typed_array(values, dtype=None):
+    """
+    plotly.js typed array spec ({'dtype', 'bdata'}) for a 1-D numeric array
+    or Series, cast to `dtype` if given. The buffer is encoded in one call,
+    without creating a Python object per element.
+    """
+    arr = np.asarray(values, dtype=dtype)
+    code = TYPED_ARRAY_DTYPES[arr.dtype]
+    # plotly.js reads the buffer as little-endian
+    arr = np.ascontiguousarray(arr, dtype=arr.dtype.newbyteorder('<'))
+    return {'dtype': code, 'bdata': base64.b64encode(arr.tobytes()).decode('ascii')}
+
+
+@functools.lru_cache(maxsize=None)
+def plotly_js_version():
+    """
+    (major, minor) of the plotly.js bundled with dash's Graph component, read
+    from the banner of its file, or None when it cannot be found.
+    """
+    for module in ['dash.dcc', 'dash_core_components']:
+        try:
+            folder = pathlib.Path(importlib.import_module(module).__file__).parent
+        except ImportError:
+            continue
+        for path in sorted(folder.glob('plotly*.js')):
+            with open(path, 'rb') as f:
+                banner = f.read(512).decode('ascii', 'ignore')
+            match = re.search(r'plotly\.js v(\d+)\.(\d+)', banner)
+            if match:
+                return int(match.group(1)), int(match.group(2))
+    return None
+
+
+def typed_arrays_supported():
+    # TYPED_ARRAYS=1 or 0 overrides the check of the bundled plotly.js
+    setting = os.environ.get('TYPED_ARRAYS')
+    if setting is not None:
+        return setting == '1'
+    version = plotly_js_version()
+    return version is not None and version >= TYPED_ARRAYS_PLOTLY_JS
+
+
+def figure_array(values, dtype=None):
+    """
+    Array for a figure trace: a typed_array where the browser's plotly.js
+    decodes them, else a plain list, which older releases draw as well.
+    """
+    if typed_arrays_supported():
+        return typed_array(values, dtype)
+    return np.asarray(values, dtype=dtype).tolist()
@@ -0,0 +1,49 @@
+# Row indexes over the shared phenology frame
+import numpy as np
+
+
+class PartitionIndex(object):
+    """
+    The frame sorted by (LC_code, doy) plus offsets into it, so the rows of a
+    class, or of one (class, DOY) pair, come back as a slice instead of a
+    boolean mask over every row.
+    """
+
+    def __init__(self, df):
+        lc_codes = df['LC_code'].cat.categories.tolist()
+        doys = np.unique(df['doy'].to_numpy())
+        self._lc_pos = {code: i for i, code in enumerate(lc_codes)}
+        self._doy_pos = {doy: j for j, doy in enumerate(doys.tolist())}
+        self.n_doys = len(doys)
+
+        # One integer key per row, ordered by class then DOY
+        lc_pos = df['LC_code'].cat.codes.to_numpy().astype(np.int64)
+        key = lc_pos * self.n_doys + np.searchsorted(doys, df['doy'].to_numpy())
+        order = np.argsort(key, kind='stable')
+        self.df = df.take(order).reset_index(drop=True)
+
+        counts = np.bincount(key, minlength=len(lc_codes) * self.n_doys)
+        self.offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.offsets[1:])
+
+    def bounds(self, lc, doy=None):
+        # (start, stop) rows of a class, or of a class on one DOY
+        i = self._lc_pos.get(int(lc))
+        if i is None:
+            return 0, 0
+        if doy is None:
+            return self.offsets[i * self.n_doys], self.offsets[(i + 1) * self.n_doys]
+        j = self._doy_pos.get(int(doy))
+        if j is None:
+            return 0, 0
+        k = i * self.n_doys + j
+        return self.offsets[k], self.offsets[k + 1]
+
+    def rows(self, lc, doy=None):
+        """
+        Rows for land cover class `lc` (and `doy` when given). The result is a
+        slice of the shared frame and must not be modified in place.
+        """
+        start, stop = self.bounds(lc, doy)
+        return self.df.iloc[start:stop]
+
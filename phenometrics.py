@@ -0,0 +1,89 @@
+# Phenometrics of every point, from the smoothed (points x DOYs) NDVI array
+import os
+
+import numpy as np
+import pandas as pd
+
+import timeseries
+
+# Start and end of season are where the curve crosses this fraction of the
+# amplitude between the minimum on that side of the peak and the peak
+THRESHOLD = float(os.environ.get('PHENO_THRESHOLD', 0.2))
+
+METRICS = ['sos', 'eos', 'peak_doy', 'peak_ndvi', 'amplitude', 'season_length']
+
+
+def _crossing(doys, y, rows, i0, i1, level):
+    # DOY where the segment between columns i0 and i1 reaches `level`
+    x0, x1 = doys[i0], doys[i1]
+    y0, y1 = y[rows, i0], y[rows, i1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = np.where(y1 != y0, (level - y0) / (y1 - y0), 0)
+    return x0 + t * (x1 - x0)
+
+
+def _extract(smoothed, doys, threshold):
+    y = np.asarray(smoothed, dtype=np.float32)
+    n, m = y.shape
+    out = np.full((n, len(METRICS)), np.nan, dtype=np.float32)
+    if n == 0 or m < 2:
+        return out
+
+    doys = np.asarray(doys, dtype=np.float32)
+    rows = np.arange(n)
+    cols = np.arange(m)
+    missing = np.isnan(y)
+    has_data = ~missing.all(axis=1)
+
+    peak = np.where(missing, -np.inf, y).argmax(axis=1)
+    peak_ndvi = y[rows, peak]
+    before = cols[None, :] <= peak[:, None]
+    after = cols[None, :] >= peak[:, None]
+    left_min = np.where(before & ~missing, y, np.inf).min(axis=1)
+    right_min = np.where(after & ~missing, y, np.inf).min(axis=1)
+    left_level = left_min + threshold * (peak_ndvi - left_min)
+    right_level = right_min + threshold * (peak_ndvi - right_min)
+
+    # Start: last column before the peak still under the left level
+    under = (y < left_level[:, None]) & (cols[None, :] < peak[:, None])
+    i = np.where(under, cols, -1).max(axis=1)
+    i = np.where(i < peak, i, -1)
+    i0 = i.clip(0, m - 2)
+    sos = np.where(i >= 0, _crossing(doys, y, rows, i0, i0 + 1, left_level), np.nan)
+
+    # End: first column after the peak back under the right level
+    under = (y < right_level[:, None]) & (cols[None, :] > peak[:, None])
+    k = np.where(under, cols, m).min(axis=1)
+    k1 = k.clip(1, m - 1)
+    eos = np.where(k < m, _crossing(doys, y, rows, k1 - 1, k1, right_level), np.nan)
+
+    out[:, 0] = sos
+    out[:, 1] = eos
+    out[:, 2] = doys[peak]
+    out[:, 3] = peak_ndvi
+    out[:, 4] = peak_ndvi - (left_min + right_min) / 2
+    out[:, 5] = eos - sos
+    out[~has_data] = np.nan
+    return out
+
+
+def extract(smoothed, doys, threshold=THRESHOLD, workers=None):
+    """
+    (points x METRICS) float32 array of start and end of season (DOY), peak
+    DOY, peak NDVI, amplitude and season length (days) of each row of
+    `smoothed`, a gap-free smoothed NDVI array such as dataset.get_smoothed.
+    Start or end is NaN when the curve never crosses its level on that side
+    of the peak. Blocks of rows run on `workers` threads, default all cores.
+    """
+    return timeseries.chunked(_extract, smoothed, doys, threshold,
+                              workers=workers or os.cpu_count())
+
+
+def phenometrics_table(cube, smoothed, rows=slice(None), threshold=THRESHOLD, workers=None):
+    # One row per point of `rows` of the cube, in cube order, from their
+    # smoothed curves
+    values = extract(smoothed, cube.doys, threshold, workers)
+    table = pd.DataFrame(values, columns=METRICS)
+    table.insert(0, 'PointID', cube.point_ids[rows].astype(str))
+    table.insert(1, 'LC_code', cube.lc[rows])
+    return table
@@ -0,0 +1,185 @@
+# Per land cover class (or cluster) summaries of the NDVI cube for the tab
+# figures
+import os
+
+import numpy as np
+
+import dataset
+from caching import LRUCache, SingleFlight, cached_call
+import timeseries
+
+# Fraction of the observations in each local fit, as in statsmodels' lowess
+LOWESS_FRAC = float(os.environ.get('LOWESS_FRAC', 2.0 / 3))
+
+# Summaries keyed by (dataset version, kind, class, parameters)
+summary_cache = LRUCache(maxsize=int(os.environ.get('SUMMARY_CACHE_SIZE', 1024)))
+_flights = SingleFlight()
+
+
+def class_summary(kind, lc, func, *params):
+    """
+    func(view, *params) for the PointView of group `lc` (a land cover class
+    or a cluster, see dataset.get_view), computed once per dataset version
+    and cached.
+    """
+    key = (dataset.dataset_version(), kind, str(lc)) + params
+    return cached_call(summary_cache, _flights, key,
+                       lambda: func(dataset.get_view(lc), *params))
+
+
+def doy_moments(ndvi):
+    # Count and sum of the non-missing values of each DOY column
+    valid = ~np.isnan(ndvi)
+    return valid.sum(axis=0), np.where(valid, ndvi, 0).sum(axis=0, dtype=np.float64)
+
+
+def binned_lowess(x, counts, sums, frac=LOWESS_FRAC, at=None):
+    """
+    LOWESS of observations binned at the distinct values `x`, given the count
+    and the sum of y per bin, evaluated at `at` (default `x`).
+
+    Every observation in a bin shares its x, so each local linear fit only
+    needs weighted bin sums: the cost depends on the number of bins, not of
+    observations. Neighbourhoods hold the nearest frac * n observations with
+    tricube weights, like statsmodels' lowess without robustness iterations.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    counts = np.asarray(counts, dtype=np.float64)
+    sums = np.asarray(sums, dtype=np.float64)
+    keep = counts > 0
+    x, counts, sums = x[keep], counts[keep], sums[keep]
+    at = x if at is None else np.asarray(at, dtype=np.float64)
+    if len(x) == 0:
+        return np.full(len(at), np.nan)
+
+    # Radius of each neighbourhood: distance to the bin that brings it to
+    # frac * n observations
+    dist = np.abs(at[:, None] - x[None, :])
+    order = np.argsort(dist, axis=1, kind='stable')
+    reach = np.cumsum(counts[order], axis=1) >= frac * counts.sum()
+    last = np.where(reach.any(axis=1), reach.argmax(axis=1), len(x) - 1)
+    radius = np.take_along_axis(dist, order, axis=1)[np.arange(len(at)), last]
+    # Widened a hair so the farthest bin of the neighbourhood keeps a weight
+    radius = (np.maximum(radius, 1e-9) * (1 + 1e-6))[:, None]
+
+    w = np.clip(1 - (dist / radius) ** 3, 0, None) ** 3
+
+    sw = w @ counts
+    swx = w @ (counts * x)
+    swxx = w @ (counts * x * x)
+    swy = w @ sums
+    swxy = w @ (x * sums)
+    denom = sw * swxx - swx * swx
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = np.where(np.abs(denom) > 1e-9 * sw * sw,
+                         (sw * swxy - swx * swy) / denom, 0.0)
+        return (swy - slope * swx) / sw + slope * at
+
+
+def _lowess_trend(view, frac, step):
+    counts, sums = doy_moments(view.ndvi)
+    doys = view.doys.astype(np.float64)
+    at = np.arange(doys.min(), doys.max() + 1, step) if len(doys) else doys
+    return at, binned_lowess(doys, counts, sums, frac, at)
+
+
+def lowess_trend(lc, frac=LOWESS_FRAC, step=1):
+    """
+    (doy, ndvi) LOWESS trendline of all observations of class `lc`,
+    evaluated every `step` days.
+    """
+    return class_summary('lowess', lc, _lowess_trend, float(frac), int(step))
+
+
+def _smoothed_median(view, window, order):
+    smoothed = dataset.get_smoothed(window, order)[view.rows]
+    median = np.full(len(view.doys), np.nan, dtype=np.float32)
+    has_data = ~np.isnan(smoothed).all(axis=0)
+    median[has_data] = np.nanmedian(smoothed[:, has_data], axis=0)
+    return view.doys, median
+
+
+def smoothed_median(lc, window=timeseries.SAVGOL_WINDOW, order=timeseries.SAVGOL_ORDER):
+    """
+    (doy, ndvi) median over the points of class `lc` of their
+    Savitzky-Golay smoothed curves (dataset.get_smoothed).
+    """
+    return class_summary('smoothed_median', lc, _smoothed_median, int(window), int(order))
+
+
+def sample_points(view, max_points, seed=0):
+    """
+    (doy, ndvi) of all observations of at most `max_points` points of the
+    class, picked at random but the same on every call.
+    """
+    rows = np.arange(len(view))
+    if len(rows) > max_points:
+        rows = np.sort(np.random.default_rng(seed).choice(rows, max_points, replace=False))
+    ndvi = view.ndvi[rows]
+    valid = ~np.isnan(ndvi)
+    doys = np.broadcast_to(view.doys, ndvi.shape)
+    return doys[valid], ndvi[valid]
+
+
+# Points of the common NDVI grid each DOY's density is evaluated on
+KDE_GRID_SIZE = 128
+# Fine histogram bins the observations are counted in before smoothing
+KDE_BINS = 1024
+
+
+def _violin_stats(view):
+    ndvi = view.ndvi.astype(np.float64)
+    counts = (~np.isnan(ndvi)).sum(axis=0)
+    has_data = counts > 0
+    ndvi, counts = ndvi[:, has_data], counts[has_data]
+    doys = view.doys[has_data]
+    if not len(doys):
+        # A class without observations (e.g. one the dataset does not cover)
+        empty = np.zeros(0)
+        return {
+            'doys': doys, 'count': counts, 'min': empty, 'max': empty,
+            'q1': empty, 'median': empty, 'q3': empty, 'lower': empty, 'upper': empty,
+            'bandwidth': empty, 'grid': np.linspace(0.0, 1.0, KDE_GRID_SIZE),
+            'density': np.zeros((0, KDE_GRID_SIZE)),
+        }
+
+    with np.errstate(invalid='ignore'):
+        q1, median, q3 = np.nanquantile(ndvi, [0.25, 0.5, 0.75], axis=0)
+        lo, hi = np.nanmin(ndvi, axis=0), np.nanmax(ndvi, axis=0)
+        # Whiskers end at the most extreme values within 1.5 IQR of the box
+        iqr = q3 - q1
+        lower = np.nanmin(np.where(ndvi >= q1 - 1.5 * iqr, ndvi, np.nan), axis=0)
+        upper = np.nanmax(np.where(ndvi <= q3 + 1.5 * iqr, ndvi, np.nan), axis=0)
+
+    # Gaussian KDE per DOY with plotly.js' default bandwidth, from a fine
+    # histogram so the cost does not grow with the number of points
+    std = np.nanstd(ndvi, axis=0)
+    spread = np.where(iqr > 0, np.minimum(std, iqr / 1.349), std)
+    bandwidth = np.maximum(1.059 * spread * counts ** -0.2, 1.0)
+    vmin, vmax = lo.min(), max(hi.max(), lo.min() + 1.0)
+    grid = np.linspace(vmin, vmax, KDE_GRID_SIZE)
+    width = (vmax - vmin) / KDE_BINS
+    centers = vmin + width * (np.arange(KDE_BINS) + 0.5)
+
+    valid = ~np.isnan(ndvi)
+    bins = ((ndvi[valid] - vmin) / width).astype(np.int64).clip(0, KDE_BINS - 1)
+    cols = np.nonzero(valid)[1]
+    hist = np.bincount(cols * KDE_BINS + bins,
+                       minlength=len(doys) * KDE_BINS).reshape(len(doys), KDE_BINS)
+    z = (grid[None, :, None] - centers[None, None, :]) / bandwidth[:, None, None]
+    density = np.einsum('dgb,db->dg', np.exp(-0.5 * z * z), hist)
+    density /= (counts * bandwidth * np.sqrt(2 * np.pi))[:, None]
+
+    return {
+        'doys': doys, 'count': counts, 'min': lo, 'max': hi,
+        'q1': q1, 'median': median, 'q3': q3, 'lower': lower, 'upper': upper,
+        'bandwidth': bandwidth, 'grid': grid, 'density': density,
+    }
+
+
+def violin_stats(lc):
+    """
+    Box plot statistics (quartiles, whiskers, min, max) and a Gaussian KDE on
+    a common grid for each DOY of class `lc`, as arrays over its DOYs.
+    """
+    return class_summary('violin', lc, _violin_stats)
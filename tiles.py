@@ -0,0 +1,120 @@
+# XYZ raster tiles of the datashader point layer, served from app.server
+import hashlib
+import io
+import os
+
+import datashader as ds
+from datashader import transfer_functions as tf
+from datashader.utils import lnglat_to_meters
+import flask
+import numpy as np
+import pandas as pd
+
+import clustering
+from controls import NLCD_2011
+import dataset
+from caching import LRUCache
+
+TILE_SIZE = 256
+# Half the width of the Web Mercator square, in metres
+ORIGIN = 20037508.342789244
+# Browser cache lifetime of a tile; tile URLs change with the dataset version
+MAX_AGE = int(os.environ.get('TILE_MAX_AGE', 24 * 3600))
+
+# version is tile_version(), lc a group of dataset.get_view: a land cover
+# class or a cluster
+TILE_ROUTE = '/tiles/<version>/<lc>/<int:doy>/<int:z>/<int:x>/<int:y>.png'
+
+# Rendered PNGs keyed by (dataset version, group, DOY, z, x, y)
+tile_cache = LRUCache(maxsize=int(os.environ.get('TILE_CACHE_SIZE', 4096)),
+                      maxbytes=int(float(os.environ.get('TILE_CACHE_MB', 256)) * 2 ** 20))
+# Shading of the point counts per pixel. Every tile of a group uses the same
+# span, from one point to all of them, so colours match across tile edges
+# and zoom levels.
+SHADE_HOW = 'log'
+
+# Web Mercator coordinates of all points of one group
+_mercator_cache = LRUCache(maxsize=64)
+
+
+def tile_version():
+    # Short key of the dataset version for tile URLs, so browsers and proxies
+    # never keep showing tiles of a rebuilt dataset
+    return hashlib.sha1(dataset.dataset_version().encode()).hexdigest()[:12]
+
+
+def tile_url(url_root, lc, doy):
+    # Tile template for a mapbox raster layer
+    return '{}tiles/{}/{}/{}/{{z}}/{{x}}/{{y}}.png'.format(url_root, tile_version(), lc, int(doy))
+
+
+def is_group(lc):
+    # An NLCD class code or a cluster of the current clustering, the groups
+    # the app offers; other names would each add a view and tiles to caches
+    lc = str(lc)
+    if lc.startswith(dataset.CLUSTER_PREFIX):
+        number = lc[len(dataset.CLUSTER_PREFIX):]
+        return number.isdigit() and int(number) < clustering.N_CLUSTERS
+    return lc in NLCD_2011
+
+
+def tile_bounds(z, x, y):
+    # (x_range, y_range) of tile z/x/y in Web Mercator metres
+    size = 2 * ORIGIN / 2 ** z
+    xmin = -ORIGIN + x * size
+    ymax = ORIGIN - y * size
+    return (xmin, xmin + size), (ymax - size, ymax)
+
+
+def mercator_points(lc, doy):
+    # Projected once per group; a DOY only selects the points with a value
+    view = dataset.get_view(lc)
+    key = (dataset.dataset_version(), lc)
+    cached = _mercator_cache.get(key)
+    if cached is None:
+        # Along with the points having any value, which stand for days
+        # between composites (interpolated layers)
+        cached = lnglat_to_meters(view.lon, view.lat) + (~np.isnan(view.ndvi).all(axis=1),)
+        _mercator_cache.put(key, cached)
+    x, y, has_data = cached
+    j = view.cube.doy_col(doy)
+    valid = has_data if j is None else ~np.isnan(view.column(j))
+    return pd.DataFrame({'x': x[valid], 'y': y[valid]})
+
+
+def render_tile(lc, doy, z, x, y):
+    x_range, y_range = tile_bounds(z, x, y)
+    cvs = ds.Canvas(plot_width=TILE_SIZE, plot_height=TILE_SIZE,
+                    x_range=x_range, y_range=y_range)
+    agg = cvs.points(mercator_points(lc, doy), x='x', y='y')
+    span = [1, max(len(dataset.get_view(lc)), 2)]
+    buf = io.BytesIO()
+    tf.shade(agg, how=SHADE_HOW, span=span).to_pil().save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def tile_view(version, lc, doy, z, x, y):
+    if not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        flask.abort(404)
+    if version != tile_version():
+        # A URL of a previous dataset version
+        flask.abort(404)
+    if not is_group(lc):
+        flask.abort(404)
+
+    version = dataset.dataset_version()
+    key = (version, lc, doy, z, x, y)
+    png = tile_cache.get(key)
+    if png is None:
+        png = render_tile(lc, doy, z, x, y)
+        tile_cache.put(key, png)
+
+    response = flask.Response(png, mimetype='image/png')
+    response.cache_control.public = True
+    response.cache_control.max_age = MAX_AGE
+    response.set_etag('{}-{}-{}-{}-{}-{}'.format(*key))
+    return response.make_conditional(flask.request)
+
+
+def init_app(server):
+    server.add_url_rule(TILE_ROUTE, 'tiles', tile_view)
@@ -0,0 +1,186 @@
+# Vectorized operations along the DOY axis of (points x DOYs) NDVI arrays
+from concurrent import futures
+import os
+
+import numpy as np
+from scipy import interpolate, signal
+
+# Savitzky-Golay window (in composites, odd) and polynomial order
+SAVGOL_WINDOW = int(os.environ.get('SAVGOL_WINDOW', 5))
+SAVGOL_ORDER = int(os.environ.get('SAVGOL_ORDER', 2))
+# Rows processed at a time, which bounds the temporary arrays
+CHUNK_ROWS = 100000
+
+
+def chunked(func, ndvi, *args, workers=1, **kwargs):
+    """
+    func(rows, *args, **kwargs) over blocks of CHUNK_ROWS rows of `ndvi`,
+    stacked into one array. With workers > 1 blocks run on a thread pool,
+    which NumPy keeps busy since it releases the GIL in array operations.
+    """
+    blocks = [ndvi[start:start + CHUNK_ROWS] for start in range(0, len(ndvi), CHUNK_ROWS)]
+    if workers > 1 and len(blocks) > 1:
+        with futures.ThreadPoolExecutor(min(workers, len(blocks))) as pool:
+            parts = list(pool.map(lambda block: func(block, *args, **kwargs), blocks))
+    else:
+        parts = [func(block, *args, **kwargs) for block in blocks]
+    if not parts:
+        return func(ndvi[:0], *args, **kwargs)
+    return np.concatenate(parts)
+
+
+def _fill_linear(ndvi, doys):
+    ndvi = np.asarray(ndvi, dtype=np.float32)
+    m = ndvi.shape[1]
+    valid = ~np.isnan(ndvi)
+    cols = np.arange(m, dtype=np.int16)
+
+    # Column of the previous and next valid value of each cell
+    prev = np.maximum.accumulate(np.where(valid, cols, -1).astype(np.int16), axis=1)
+    nxt = np.minimum.accumulate(
+        np.where(valid, cols, m).astype(np.int16)[:, ::-1], axis=1)[:, ::-1]
+    # Before the first or after the last value, hold the nearest one
+    prev = np.where(prev < 0, nxt, prev).clip(0, m - 1)
+    nxt = np.where(nxt >= m, prev, nxt).clip(0, m - 1)
+
+    x = np.asarray(doys, dtype=np.float32)
+    x0, x1 = x[prev], x[nxt]
+    y0 = np.take_along_axis(ndvi, prev, axis=1)
+    y1 = np.take_along_axis(ndvi, nxt, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = np.where(x1 > x0, (x[None, :] - x0) / (x1 - x0), 0)
+    return np.where(valid, ndvi, y0 + t * (y1 - y0))
+
+
+def fill_linear(ndvi, doys):
+    """
+    `ndvi` with its missing values (NaN) linearly interpolated along each
+    row over `doys`, holding the first or last value at the ends. Rows with
+    no value stay NaN.
+    """
+    return chunked(_fill_linear, ndvi, doys)
+
+
+def _savgol(ndvi, doys, window, order):
+    filled = _fill_linear(ndvi, doys)
+    # Shrink the window to the longest odd one a series can hold
+    m = filled.shape[1]
+    window = min(window, m if m % 2 else m - 1)
+    if window <= order or not len(filled):
+        return filled
+    # After filling, only rows without any value still hold NaN
+    has_data = ~np.isnan(filled[:, 0]) if m else np.zeros(len(filled), dtype=bool)
+    filled[has_data] = signal.savgol_filter(filled[has_data], window, order,
+                                            axis=1, mode='interp')
+    return filled
+
+
+def savgol(ndvi, doys, window=SAVGOL_WINDOW, order=SAVGOL_ORDER, workers=1):
+    """
+    Savitzky-Golay smoothing of every row of `ndvi` along the DOY axis, after
+    filling its gaps with fill_linear. Composites are taken as evenly spaced.
+    """
+    if window % 2 == 0 or order >= window:
+        raise ValueError('Savitzky-Golay window must be odd and larger than the order, '
+                         'got window {} and order {}'.format(window, order))
+    return chunked(_savgol, ndvi, doys, window, order, workers=workers)
+
+
+# Harmonics per year fitted by default; each adds a cosine and a sine term
+N_HARMONICS = int(os.environ.get('HARMONICS', 2))
+YEAR = 365.25
+
+
+def harmonic_design(doys, n_harmonics=N_HARMONICS):
+    """
+    (len(doys) x 2 * n_harmonics + 1) regressors: a constant, then the
+    cosine and sine of each harmonic of the year.
+    """
+    t = 2 * np.pi * np.asarray(doys, dtype=np.float64) / YEAR
+    columns = [np.ones_like(t)]
+    for k in range(1, n_harmonics + 1):
+        columns += [np.cos(k * t), np.sin(k * t)]
+    return np.stack(columns, axis=1)
+
+
+def _harmonic_fit(ndvi, doys, n_harmonics):
+    X = harmonic_design(doys, n_harmonics)
+    n_coefs = X.shape[1]
+    valid = ~np.isnan(ndvi)
+    y = np.where(valid, ndvi, 0).astype(np.float64)
+
+    # Normal equations of every row at once; missing values get no weight
+    A = np.einsum('nm,mp,mq->npq', valid.astype(np.float64), X, X)
+    b = y @ X
+    enough = valid.sum(axis=1) >= n_coefs
+    A[~enough] = np.eye(n_coefs)
+    coefs = np.linalg.solve(A, b[:, :, None])[:, :, 0]
+    coefs[~enough] = np.nan
+    return coefs.astype(np.float32)
+
+
+def harmonic_fit(ndvi, doys, n_harmonics=N_HARMONICS, workers=1):
+    """
+    Least squares harmonic coefficients of every row of `ndvi`, ignoring its
+    missing values, as a (points x 2 * n_harmonics + 1) float32 array. Rows
+    with fewer values than coefficients get NaN.
+    """
+    return chunked(_harmonic_fit, ndvi, doys, n_harmonics, workers=workers)
+
+
+def harmonic_curves(coefs, doys):
+    """
+    Curves of the rows of `coefs` (from harmonic_fit) on any `doys`, as a
+    (points x len(doys)) float32 array.
+    """
+    n_harmonics = (coefs.shape[1] - 1) // 2
+    design = harmonic_design(doys, n_harmonics).astype(np.float32)
+    return np.asarray(coefs, dtype=np.float32) @ design.T
+
+
+# Spacing in days of the regular series built by resample
+INTERP_STEP = int(os.environ.get('INTERP_STEP', 1))
+INTERP_METHODS = ['linear', 'spline', 'harmonic']
+
+
+def regular_doys(step=INTERP_STEP):
+    # Every `step` days of the year, from DOY 1
+    return np.arange(1, 367, step, dtype=np.int16)
+
+
+def _resample(ndvi, doys, at, method):
+    if method == 'harmonic':
+        # Fitted to the values present; no gap filling needed
+        return harmonic_curves(_harmonic_fit(ndvi, doys, N_HARMONICS), at)
+
+    filled = _fill_linear(ndvi, doys)
+    x = np.asarray(doys, dtype=np.float64)
+    if len(x) < 2:
+        return np.repeat(filled[:, :1], len(at), axis=1)
+    # Outside the composites the first or last value is held
+    t = np.clip(np.asarray(at, dtype=np.float64), x[0], x[-1])
+
+    if method == 'spline':
+        out = np.full((len(filled), len(t)), np.nan, dtype=np.float32)
+        has_data = ~np.isnan(filled[:, 0])
+        if has_data.any():
+            out[has_data] = interpolate.PchipInterpolator(x, filled[has_data], axis=1)(t)
+        return out
+
+    hi = np.searchsorted(x, t, side='right').clip(1, len(x) - 1)
+    lo = hi - 1
+    w = ((t - x[lo]) / (x[hi] - x[lo])).astype(np.float32)
+    return filled[:, lo] * (1 - w) + filled[:, hi] * w
+
+
+def resample(ndvi, doys, at, method='linear', workers=1):
+    """
+    Gap-filled NDVI of every row of `ndvi` on the DOYs `at`, interpolated
+    between the composites `doys` linearly, with a monotone cubic spline
+    (PCHIP, which does not overshoot between composites) or from a harmonic
+    fit of N_HARMONICS harmonics.
+    """
+    if method not in INTERP_METHODS:
+        raise ValueError('Unknown interpolation method {!r}, expected one of {}'.format(
+            method, INTERP_METHODS))
+    return chunked(_resample, ndvi, doys, at, method, workers=workers)
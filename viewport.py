@@ -0,0 +1,101 @@
+# Map viewport handling: bounds from relayoutData and a point budget per view
+import math
+
+import numpy as np
+import pandas as pd
+
+# Assumed size of the map in pixels when relayoutData has no corner coordinates
+MAP_WIDTH_PX = 1600
+MAP_HEIGHT_PX = 700
+MAX_LAT = 85.0511
+
+
+def _lat_to_y(lat):
+    return math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+
+
+def _y_to_lat(y):
+    return math.degrees(2 * math.atan(math.exp(y)) - math.pi / 2)
+
+
+def viewport_bounds(relayout_data):
+    """
+    (lon_min, lon_max, lat_min, lat_max) of the map view from the map's
+    relayoutData, or None when the view is not known (first render, autosize).
+    """
+    if not relayout_data:
+        return None
+
+    derived = relayout_data.get('mapbox._derived')
+    if derived and derived.get('coordinates'):
+        lons, lats = zip(*derived['coordinates'])
+        return min(lons), max(lons), min(lats), max(lats)
+
+    if 'mapbox.center' in relayout_data and 'mapbox.zoom' in relayout_data:
+        center = relayout_data['mapbox.center']
+        # Mapbox GL renders 512px tiles, so the world is 512 * 2**zoom pixels
+        world = 512 * 2 ** relayout_data['mapbox.zoom']
+        half_width = 180.0 * MAP_WIDTH_PX / world
+        half_height = math.pi * MAP_HEIGHT_PX / world
+        y = _lat_to_y(max(-MAX_LAT, min(MAX_LAT, center['lat'])))
+        return (center['lon'] - half_width, center['lon'] + half_width,
+                max(-MAX_LAT, _y_to_lat(y - half_height)),
+                min(MAX_LAT, _y_to_lat(y + half_height)))
+
+    return None
+
+
+def aggregate(map_data, bounds, budget):
+    """
+    Bin points into a grid of at most `budget` cells over `bounds`, returning
+    one row per non-empty cell with its mean position, mean NDVI (NaN values
+    ignored) and count.
+    """
+    lon = map_data['lon'].to_numpy(dtype=np.float64)
+    lat = map_data['lat'].to_numpy(dtype=np.float64)
+    lon_min, lon_max, lat_min, lat_max = bounds
+    n = max(int(math.sqrt(budget)), 1)
+
+    ix = ((lon - lon_min) / max(lon_max - lon_min, 1e-9) * n).astype(np.int64).clip(0, n - 1)
+    iy = ((lat - lat_min) / max(lat_max - lat_min, 1e-9) * n).astype(np.int64).clip(0, n - 1)
+    cell = iy * n + ix
+
+    counts = np.bincount(cell, minlength=n * n)
+    keep = counts > 0
+    counts = counts[keep]
+
+    def cell_sum(values):
+        return np.bincount(cell, weights=values, minlength=n * n)[keep]
+
+    ndvi = map_data['ndvi'].to_numpy(dtype=np.float64)
+    valid = ~np.isnan(ndvi)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ndvi_mean = cell_sum(np.where(valid, ndvi, 0)) / cell_sum(valid)
+
+    return pd.DataFrame({
+        'lon': (cell_sum(lon) / counts).astype(np.float32),
+        'lat': (cell_sum(lat) / counts).astype(np.float32),
+        'ndvi': ndvi_mean.round().astype(np.float32),
+        'count': counts,
+    })
+
+
+def select_points(map_data, bounds, budget):
+    """
+    Points of `map_data` inside `bounds` (all of them when bounds is None).
+    Past `budget` points they are aggregated; returns (frame, aggregated).
+    """
+    if bounds is not None:
+        lon_min, lon_max, lat_min, lat_max = bounds
+        lon = map_data['lon'].to_numpy()
+        lat = map_data['lat'].to_numpy()
+        inside = (lon >= lon_min) & (lon <= lon_max) & (lat >= lat_min) & (lat <= lat_max)
+        map_data = map_data[inside]
+
+    if len(map_data) <= budget:
+        return map_data, False
+
+    if bounds is None:
+        bounds = (map_data['lon'].min(), map_data['lon'].max(),
+                  map_data['lat'].min(), map_data['lat'].max())
+    return aggregate(map_data, bounds, budget), True